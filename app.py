@@ -1,22 +1,38 @@
+import logging
+
 import dash
 import dash_bootstrap_components as dbc
 import dash_auth
-from constants import uid, pwd
+from werkzeug.middleware.proxy_fix import ProxyFix
+from constants import LOG_LEVEL, uid, pwd
 
 
 from callbacks.callbacks import register_callbacks
 from layout.layout import create_layout
+from utils.export import register_routes
+from utils.metrics import register_metrics
+from utils.tiles import register_tile_routes
+from utils.prefetch import register_warm_up
 
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(name)s %(message)s")
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.title = "Raster Stats Viz"
 server = app.server
+# TLS ends at the App Service front end, which passes the original scheme and
+# host on as X-Forwarded-* headers. Without this, URLs built from the request
+# (e.g. the map's tile and boundary URLs) come out as http:// on an https page
+server.wsgi_app = ProxyFix(server.wsgi_app, x_proto=1, x_host=1)
 auth = dash_auth.BasicAuth(app, {uid: pwd})
 
 
 app.layout = create_layout()
 
 register_callbacks(app)
+register_routes(server)
+register_metrics(server)
+register_tile_routes(server)
+register_warm_up(server)
 
 if __name__ == "__main__":
     app.run_server(debug=True)
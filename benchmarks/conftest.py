@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Settings are read when constants is imported, so they are set before any of
+# the app's modules are: the local Parquet backend on a synthetic snapshot,
+# seeded on the first run and reused when BENCHMARK_DATA_DIR already holds it
+os.environ["MODE"] = "local"
+os.environ["LOCAL_DATA_DIR"] = os.environ.get(
+    "BENCHMARK_DATA_DIR"
+) or tempfile.mkdtemp(prefix="bench-")
+os.environ["PREFETCH_ENABLED"] = "false"
@@ -0,0 +1,74 @@
+"""Time a cold import of the app, which every new gunicorn worker pays.
+
+    python -m benchmarks.startup --repeat 5 --top 15
+
+Each run imports app in a fresh interpreter, so nothing is shared with the
+previous one. Besides the wall time it lists the slowest top-level imports
+reported by python -X importtime, to show what a worker spends starting up.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+
+def import_app(env):
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - start, process.stderr
+
+
+def top_level_imports(stderr):
+    # Lines look like "import time:  self [us] | cumulative | imported package",
+    # with nested imports indented below the package that pulled them in
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:") :].split("|")
+        if not name[1:].startswith(" "):
+            cumulative[name.strip()] = int(total) / 1e6
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--mode", default="dev", help="MODE to start the app in")
+    args = parser.parse_args()
+
+    # Nothing is read from the database at import time (the cache warm-up
+    # waits for a worker's first request), so no credentials are needed
+    env = dict(os.environ, MODE=args.mode)
+    timings = []
+    imports = defaultdict(list)
+    for _ in range(args.repeat):
+        seconds, stderr = import_app(env)
+        timings.append(seconds)
+        for name, value in top_level_imports(stderr).items():
+            imports[name].append(value)
+
+    print(
+        f"import app: median {statistics.median(timings):.2f}s, "
+        f"min {min(timings):.2f}s, max {max(timings):.2f}s"
+    )
+    slowest = sorted(
+        imports.items(), key=lambda item: statistics.median(item[1]), reverse=True
+    )
+    for name, values in slowest[: args.top]:
+        print(f"  {statistics.median(values):6.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Synthetic era5/seas5/imerg data in the local Parquet layout.
+
+Pcodes come from the boundary files in data/, so every map and line chart
+scenario has matching geometry.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.sync_local import write_parquet
+from utils.boundaries import available_adm_levels, load_boundaries
+from utils.date_utils import DATASET_START
+from utils.figures import feature_pcodes
+from utils.frames import compact_frame
+from utils.local_backend import partition_dir, table_path
+
+END_DATE = "2024-09-01"
+ISO3S = ("AFG", "BRA", "ETH", "MDV")
+
+
+def valid_dates(dataset, end=END_DATE):
+    freq = "D" if dataset == "imerg" else "MS"
+    return pd.date_range(DATASET_START[dataset], end, freq=freq)
+
+
+def make_slice(dataset, iso3, adm_level, rng):
+    pcodes = feature_pcodes(load_boundaries(iso3, adm_level), adm_level)
+    dates = valid_dates(dataset)
+    leadtimes = range(7) if dataset == "seas5" else [None]
+    frames = []
+    for lt in leadtimes:
+        n = len(dates) * len(pcodes)
+        mean = rng.gamma(2.0, 20.0, n)
+        df = pd.DataFrame(
+            {
+                "iso3": iso3,
+                "pcode": np.tile(pcodes, len(dates)),
+                "adm_level": adm_level,
+                "valid_date": np.repeat(dates, len(pcodes)),
+                "mean": mean,
+                "median": mean * rng.uniform(0.8, 1.0, n),
+                "max": mean * rng.uniform(1.5, 3.0, n),
+                "min": mean * rng.uniform(0.0, 0.5, n),
+                "std": mean * rng.uniform(0.1, 0.4, n),
+                "count": rng.integers(10, 5000, n),
+                "sum": mean * 1000,
+            }
+        )
+        if lt is not None:
+            df["leadtime"] = lt
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    keys = [k for k in ("valid_date", "leadtime", "pcode") if k in df]
+    return compact_frame(df.sort_values(keys, ignore_index=True))
+
+
+def seed(datasets=("era5", "seas5", "imerg"), iso3s=ISO3S, seed_value=0):
+    """Write a full synthetic snapshot to LOCAL_DATA_DIR."""
+    rng = np.random.default_rng(seed_value)
+    iso3_rows = []
+    completeness = {dataset: [] for dataset in datasets}
+    for iso3 in iso3s:
+        levels = available_adm_levels(iso3)
+        total_pcodes = 0
+        for adm_level in levels:
+            total_pcodes += len(load_boundaries(iso3, adm_level)["features"])
+            for dataset in datasets:
+                df = make_slice(dataset, iso3, adm_level, rng)
+                path = os.path.join(
+                    partition_dir(dataset, iso3, adm_level), "part-0.parquet"
+                )
+                write_parquet(df, path)
+                years = df.groupby(df.valid_date.dt.year)
+                completeness[dataset].append(
+                    pd.DataFrame(
+                        {
+                            "iso3": iso3,
+                            "adm_level": adm_level,
+                            "year": years.size().index,
+                            "total_rows": years.size().values,
+                            "unique_dates": years.valid_date.nunique().values,
+                            "unique_pcodes": years.pcode.nunique().values,
+                        }
+                    )
+                )
+        iso3_rows.append(
+            {
+                "iso3": iso3,
+                "stats_last_updated": "2024-10-10",
+                "total-pcodes": total_pcodes,
+                "max_adm_level": max(levels),
+            }
+        )
+    write_parquet(pd.DataFrame(iso3_rows), table_path("iso3"))
+    for dataset, frames in completeness.items():
+        write_parquet(pd.concat(frames), table_path(f"{dataset}_completeness"))
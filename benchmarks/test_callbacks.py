@@ -0,0 +1,149 @@
+"""Benchmarks for the callback hot paths, run against synthetic local data.
+
+    export BENCHMARK_DATA_DIR=/tmp/bench-data
+    python -m pytest benchmarks --benchmark-json results.json
+
+The app runs in MODE=local on a Parquet snapshot seeded by
+benchmarks/synthetic.py, and each callback is called directly, without the
+Dash HTTP layer. Besides pytest-benchmark's timings, every scenario records
+its p95 latency, the size of the JSON sent to the browser and the peak Python
+memory (including numpy buffers, but not Arrow's own allocator) in
+extra_info.
+"""
+
+import os
+import tracemalloc
+from functools import partial
+
+import dash
+import plotly.io as pio
+import pytest
+
+from benchmarks.synthetic import seed
+from callbacks.callbacks import register_callbacks
+from constants import LOCAL_DATA_DIR
+from layout.layout import create_layout
+from tests.dash_harness import collect_callbacks, set_triggered
+from utils import climatology, local_backend, series
+from utils.boundaries import get_map_view, load_boundaries
+from utils.data_processing import make_data_handle
+
+ROUNDS = int(os.environ.get("BENCHMARK_ROUNDS", 5))
+DATE = "2020-07-15"
+SLICES = {
+    "era5_ETH_1": make_data_handle("ETH", 1, "era5"),
+    "seas5_MDV_3_lt0": make_data_handle("MDV", 3, "seas5", "0"),
+    "imerg_MDV_3": make_data_handle("MDV", 3, "imerg"),
+}
+FIRST_BLOCK = {"startRow": 0, "endRow": 100, "sortModel": [], "filterModel": {}}
+SORTED_BLOCK = {
+    "startRow": 5000,
+    "endRow": 5100,
+    "sortModel": [{"colId": "mean", "sort": "desc"}],
+    "filterModel": {},
+}
+
+
+@pytest.fixture(scope="session")
+def callbacks():
+    if not os.path.exists(os.path.join(LOCAL_DATA_DIR, "iso3.parquet")):
+        seed()
+    app = dash.Dash(__name__)
+    app.layout = create_layout()
+    register_callbacks(app)
+    # Tile-mode maps build their URLs from the current request
+    with app.server.test_request_context():
+        yield collect_callbacks(app)
+
+
+def clear_caches():
+    local_backend.fetch_slice.cache_clear()
+    load_boundaries.cache_clear()
+    get_map_view.cache_clear()
+    series._build_index.cache_clear()
+    climatology._build_climatology.cache_clear()
+
+
+def measure(benchmark, fn, setup=None):
+    """Time fn, then record its p95, payload and peak memory in extra_info."""
+
+    def prepare():
+        if setup is not None:
+            setup()
+
+    result = benchmark.pedantic(fn, setup=prepare, rounds=ROUNDS, iterations=1)
+    # Traced separately, tracemalloc would slow down the timed rounds
+    prepare()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    benchmark.extra_info["payload_bytes"] = len(pio.json.to_json_plotly(result))
+    benchmark.extra_info["peak_mb"] = peak / 2**20
+    if benchmark.stats is not None:
+        timings = sorted(benchmark.stats.stats.data)
+        p95 = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+        benchmark.extra_info["p95_ms"] = p95 * 1000
+
+
+def test_get_map_view_cold(benchmark):
+    measure(benchmark, lambda: get_map_view("MDV", 3), clear_caches)
+
+
+def test_load_boundaries_cold(benchmark):
+    measure(benchmark, lambda: load_boundaries("MDV", 3), clear_caches)
+
+
+def test_update_completeness_table(benchmark, callbacks):
+    measure(benchmark, lambda: callbacks["update_completeness_table"]("era5"))
+
+
+@pytest.mark.parametrize("name", SLICES)
+def test_update_pcodes_cold(benchmark, callbacks, name):
+    measure(benchmark, lambda: callbacks["update_pcodes"](SLICES[name]), clear_caches)
+
+
+@pytest.mark.parametrize("name", SLICES)
+def test_update_pcodes_warm(benchmark, callbacks, name):
+    measure(benchmark, lambda: callbacks["update_pcodes"](SLICES[name]))
+
+
+@pytest.mark.parametrize(
+    "stat, map_mode, trigger",
+    [
+        ("mean", "tiles", "df-store.data"),
+        ("mean", "inline", "df-store.data"),
+        # Only the values are patched into the figure
+        ("mean", "tiles", "date-picker.value"),
+        ("anomaly", "tiles", "df-store.data"),
+    ],
+    ids=["full", "inline", "patch", "anomaly"],
+)
+@pytest.mark.parametrize("name", SLICES)
+def test_update_charts(benchmark, callbacks, name, stat, map_mode, trigger):
+    measure(
+        benchmark,
+        lambda: callbacks["update_charts"](SLICES[name], DATE, stat, map_mode),
+        partial(set_triggered, trigger),
+    )
+
+
+@pytest.mark.parametrize(
+    "trigger", ["pcodes.value", "date-picker.value"], ids=["pcodes", "date"]
+)
+@pytest.mark.parametrize("name", SLICES)
+def test_create_line_chart(benchmark, callbacks, name, trigger):
+    handle = SLICES[name]
+    # Five lines, as a user comparing a handful of districts would
+    pcodes = callbacks["update_pcodes"](handle)[0][:5]
+    measure(
+        benchmark,
+        lambda: callbacks["create_line_chart"](pcodes, DATE, "mean", handle),
+        partial(set_triggered, trigger),
+    )
+
+
+@pytest.mark.parametrize("block", [FIRST_BLOCK, SORTED_BLOCK], ids=["first", "sorted"])
+@pytest.mark.parametrize("name", SLICES)
+def test_serve_grid_rows(benchmark, callbacks, name, block):
+    measure(benchmark, lambda: callbacks["serve_grid_rows"](block, SLICES[name]))
@@ -1,64 +1,100 @@
 import dash
-import pandas as pd
-import plotly.express as px
+import dash_mantine_components as dmc
 from dash import Input, Output, State, ctx
-from sqlalchemy import text
-from utils.data_processing import get_engine
+from dash.exceptions import PreventUpdate
 
-from constants import MODE
-from utils.components import data_grid
-from utils.data_processing import calculate_centroid, fetch_data_from_db, load_geojson
-from utils.date_utils import display_date_range, to_first_of_month
+from constants import DERIVED_STATS
+from utils.boundaries import (
+    available_adm_levels,
+    get_map_view,
+    load_boundaries,
+    tolerance_for_zoom,
+)
+from utils.climatology import fetch_derived_map
+from utils.components import comparison_map, data_grid
+from utils.data_processing import (
+    fetch_map_batch,
+    fetch_map_data,
+    load_data_handle,
+    make_data_handle,
+)
+from utils.date_utils import dates_between, display_date_range, to_first_of_month
+from utils.export import export_url
+from utils.figures import (
+    choropleth_figure,
+    choropleth_patch,
+    date_band_patch,
+    line_figure,
+)
+from utils.grid import get_rows
+from utils.metrics import instrumented_callback
+from utils.prefetch import prefetch_neighbours
+from utils.series import get_series
+from utils.summary import (
+    get_completeness_detail,
+    get_completeness_records,
+    get_row_counts,
+)
+from utils.tiles import map_urls
+from utils.timing import stage
+
+MAX_COMPARISON_MAPS = 12
 
 
 def register_callbacks(app):
-    # @app.callback(
-    #     Output("ag-grid-table", "exportDataAsCsv"),
-    #     Input("csv-download", "n_clicks"),
-    #     prevent_initial_call=True,
-    # )
-    # def export_data_as_csv(n_clicks):
-    #     if n_clicks:
-    #         return True
-    #     return False
-
-    @app.callback(
+    callback = instrumented_callback(app)
+
+    @callback(
+        Output("csv-download", "href"),
+        Input("df-store", "data"),
+    )
+    def update_csv_download(df_store):
+        # The CSV is streamed by the server, not built from the grid's rows
+        if not df_store:
+            return dash.no_update
+        return export_url(df_store)
+
+    @callback(
         Output("line", "figure"),
         Input("pcodes", "value"),
         Input("date-picker", "value"),
         Input("stat-dropdown", "value"),
         State("df-store", "data"),
-        State("ds-dropdown", "value"),
     )
-    def create_line_chart(pcodes, date, stat, df_store, dataset):
-        df = pd.DataFrame.from_dict(df_store)
-        df_ = df[df.pcode.isin(pcodes)]
-        line_chart = px.line(
-            df_, x="valid_date", y=stat, template="simple_white", color="pcode"
-        )
-        line_chart.update_layout(
-            margin={"r": 0, "t": 15, "l": 0, "b": 0}, xaxis_title=""
-        )
-        date_range = display_date_range(dataset, date)
-        line_chart.add_vrect(
-            x0=date_range[0],
-            x1=date_range[1],
-            opacity=0.2,
-            line_width=5,
-            line_color="red",
-            fillcolor="red",
-        )
-        return line_chart
+    def create_line_chart(pcodes, date, stat, df_store):
+        if not df_store or not pcodes:
+            return dash.no_update
+        date_range = display_date_range(df_store["dataset"], date)
+        # Moving the date only moves the band, the traces stay in the browser
+        if set(ctx.triggered_prop_ids) == {"date-picker.value"}:
+            return date_band_patch(date_range)
+        series = get_series(df_store, pcodes, stat)
+        with stage("figure"):
+            return line_figure(series, stat, date_range)
 
-    @app.callback(
-        Output("pcodes", "data"), Output("pcodes", "value"), Input("df-store", "data")
+    @callback(
+        Output("pcodes", "data"),
+        Output("pcodes", "value"),
+        Output("info", "children"),
+        Output("info", "title"),
+        Input("df-store", "data"),
     )
     def update_pcodes(df_store):
-        df = pd.DataFrame.from_dict(df_store)
-        pcodes = df.pcode.unique()
-        return pcodes, [pcodes[0]]
+        # The only callback that loads the full slice when the selection
+        # changes, everything else reads it back from the cache
+        if not df_store:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        df = load_data_handle(df_store)
+        prefetch_neighbours(df_store)
+        pcodes = df.pcode.unique().tolist()
+        return (
+            pcodes,
+            pcodes[:1],
+            "To do: Info for selected dataset",
+            f"{len(df)} rows returned for {df_store['dataset']}",
+        )
 
-    @app.callback(
+    @callback(
         Output("lt-dropdown", "disabled"),
         Output("date-info", "style"),
         Input("ds-dropdown", "value"),
@@ -71,156 +107,161 @@ def register_callbacks(app):
         elif dataset == "imerg":
             return True, {"display": "None"}
 
-    @app.callback(
-        Output("geojson-store", "data"),
+    @callback(
+        Output("df-store", "data"),
         Input("iso3-dropdown", "value"),
         Input("admin-level-dropdown", "value"),
+        Input("ds-dropdown", "value"),
+        Input("lt-dropdown", "value"),
+        State("df-store", "data"),
     )
-    def load_geojson_data(iso3_code, adm_level):
-        if iso3_code:
-            geojson = load_geojson(iso3_code, adm_level)
-            return geojson
-        return None
+    def update_data_store(iso3, admin_level, dataset, lt, df_store):
+        # Start of the pipeline: map, pcodes/line and grid all hang off this
+        # handle, so only fire them when the selected slice actually changes
+        lt = None if dataset in ["era5", "imerg"] else lt
+        handle = make_data_handle(iso3, admin_level, dataset, lt)
+        if handle == df_store:
+            raise PreventUpdate
+        return handle
 
-    @app.callback(
-        Output("info", "children"),
-        Output("info", "title"),
+    @callback(
+        Output("grid", "children"),
         Input("df-store", "data"),
-        State("ds-dropdown", "value"),
+        Input("tabs", "value"),
     )
-    def data_info(df, dataset):
-        return (
-            "To do: Info for selected dataset",
-            f"{len(df)} rows returned for {dataset}",
-        )
+    def update_grid(df_store, tab):
+        # The full history is only loaded once the table is actually shown.
+        # A new grid resets the row model, which then asks for its first block
+        if not df_store or tab != "table":
+            return dash.no_update
+        return data_grid(load_data_handle(df_store))
+
+    @callback(
+        Output("ag-grid-table", "getRowsResponse"),
+        Input("ag-grid-table", "getRowsRequest"),
+        State("df-store", "data"),
+    )
+    def serve_grid_rows(request, df_store):
+        if not request or not df_store:
+            raise PreventUpdate
+        return get_rows(load_data_handle(df_store), request)
 
-    @app.callback(
+    @callback(
         Output("map", "figure"),
-        Output("grid", "children"),
-        Output("df-store", "data"),
-        Input("iso3-dropdown", "value"),
-        Input("admin-level-dropdown", "value"),
+        Input("df-store", "data"),
         Input("date-picker", "value"),
-        Input("ds-dropdown", "value"),
-        Input("lt-dropdown", "value"),
         Input("stat-dropdown", "value"),
-        Input("geojson-store", "data"),
-        Input("df-store", "data"),
+        Input("map-mode", "value"),
     )
-    def update_charts(iso3, admin_level, date, dataset, lt, stat, geojson, df_store):
-        print("updating charts...")
-        # Calculate centroid
-        center_lat, center_lon = calculate_centroid(geojson)
-
-        # Get new data from database
-        if (
-            ctx.triggered_id
-            in [
-                "iso3-dropdown",
-                "admin-level-dropdown",
-                "ds-dropdown",
-                "lt-dropdown",
-                "geojson-store",
-            ]
-            and MODE != "local"
-        ):
-            print("getting new data...")
-            lt = None if dataset in ["era5", "imerg"] else lt
-            df = fetch_data_from_db(iso3, admin_level, dataset, lt)
-            df_return = df.to_dict("records")
-            ag_grid = data_grid(df)
-        elif MODE == "local":
-            print("getting cached local data...")
-            df = pd.read_csv("data/demo-export.csv")
-            df.columns = [x.lower() for x in df.columns]
-            df_return = df.to_dict("records")
-            ag_grid = data_grid(df)
-        else:
-            print("retrieving data from store...")
-            df = pd.DataFrame.from_dict(df_store)
-            df.valid_date = pd.to_datetime(df.valid_date)
-            df_return = dash.no_update
-            ag_grid = dash.no_update
+    def update_charts(df_store, date, stat, map_mode):
+        if not df_store:
+            return dash.no_update
+        iso3, admin_level = df_store["iso3"], df_store["adm_level"]
+        dataset, lt = df_store["dataset"], df_store["lt"]
+        view = get_map_view(iso3, admin_level)
+        tolerance = tolerance_for_zoom(view["zoom"])
+        geojson = load_boundaries(iso3, admin_level, tolerance)
 
         # These are the datasets with only monthly data
         if dataset in ["seas5", "era5"]:
             date = to_first_of_month(date)
 
-        df_ = df[df.valid_date == pd.to_datetime(date)]
-
-        map_chart = px.choropleth_map(
-            df_,
-            geojson=geojson,
-            locations="pcode",
-            color=stat,
-            color_continuous_scale="Blues",
-            map_style="carto-positron",
-            zoom=4,
-            center={"lat": center_lat, "lon": center_lon},
-            featureidkey=f"properties.ADM{admin_level}_PCODE",
-            opacity=0.5,
-        )
-        map_chart.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+        # Only the selected date and stat are needed for the map, derived
+        # stats come from the cached slice and its baseline instead
+        if stat in DERIVED_STATS:
+            df_ = fetch_derived_map(df_store, date, stat)
+        else:
+            df_ = fetch_map_data(iso3, admin_level, dataset, date, stat, lt)
 
-        return map_chart, ag_grid, df_return
+        # Date and stat changes keep the same geometry, so only the values
+        # are sent to the browser
+        with stage("figure"):
+            if not {"df-store.data", "map-mode.value"} & set(ctx.triggered_prop_ids):
+                return choropleth_patch(df_, stat, geojson, admin_level)
+            # In tile mode the geometry is fetched by the browser from
+            # /boundaries and /tiles, so the figure size does not depend on it
+            urls = map_urls(iso3, admin_level, tolerance) if map_mode == "tiles" else {}
+            return choropleth_figure(df_, stat, geojson, admin_level, view, **urls)
 
-    @app.callback(
+    @callback(
+        Output("compare-maps", "children"),
+        Input("compare-iso3", "value"),
+        Input("compare-dates", "value"),
+        Input("admin-level-dropdown", "value"),
+        Input("ds-dropdown", "value"),
+        Input("lt-dropdown", "value"),
+        Input("stat-dropdown", "value"),
+        Input("tabs", "value"),
+    )
+    def update_comparison(iso3s, date_range, admin_level, dataset, lt, stat, tab):
+        # Small multiples, one map per country and date, all read in one query
+        if tab != "compare" or not iso3s or not date_range or None in date_range:
+            return dash.no_update
+        lt = None if dataset in ["era5", "imerg"] else lt
+        # Countries without boundaries at the selected level fall back to
+        # their most detailed one
+        slices = [
+            (iso3, min(int(admin_level), max(available_adm_levels(iso3))))
+            for iso3 in iso3s[:MAX_COMPARISON_MAPS]
+        ]
+        # As many dates as fit in MAX_COMPARISON_MAPS maps for these countries
+        dates = dates_between(dataset, *date_range)
+        dates = dates[: MAX_COMPARISON_MAPS // len(slices)]
+        if stat in DERIVED_STATS:
+            data = {
+                (iso3, str(adm_level), date): fetch_derived_map(
+                    make_data_handle(iso3, adm_level, dataset, lt), date, stat
+                )
+                for iso3, adm_level in slices
+                for date in dates
+            }
+        else:
+            data = fetch_map_batch(slices, dataset, dates, stat, lt)
+
+        values = [df[stat] for df in data.values() if not df.empty]
+        if not values:
+            return dmc.Text(f"No {dataset} data for the selected dates")
+        zrange = (
+            float(min(v.min() for v in values)),
+            float(max(v.max() for v in values)),
+        )
+        maps = []
+        with stage("figure"):
+            for (iso3, adm_level, date), df in data.items():
+                view = get_map_view(iso3, adm_level)
+                tolerance = tolerance_for_zoom(view["zoom"])
+                geojson = load_boundaries(iso3, adm_level, tolerance)
+                # Panels of the same country share the browser's cached geometry
+                figure = choropleth_figure(
+                    df,
+                    stat,
+                    geojson,
+                    adm_level,
+                    view,
+                    zrange=zrange,
+                    **map_urls(iso3, adm_level, tolerance),
+                )
+                maps.append(comparison_map(f"{iso3} adm{adm_level} {date}", figure))
+        return maps
+
+    @callback(
         Output("completeness-table", "rowData"),
         Output("completeness-table", "selectedRows"),
+        Output("db-row-count", "children"),
         Input("ds-dropdown", "value"),
     )
     def update_completeness_table(dataset):
-        engine = get_engine(MODE)
-        query = text("SELECT * FROM public.iso3")
-        query_completeness = text(f"SELECT * FROM public.{dataset}_completeness")
-
-        with engine.connect() as con:
-            df_all_iso3s = pd.read_sql_query(query, con)
-            df_completeness = pd.read_sql_query(query_completeness, con)
-            df_merged = df_all_iso3s[
-                ["iso3", "stats_last_updated", "total-pcodes", "max_adm_level"]
-            ].merge(df_completeness, on="iso3", how="left")
-            df_grouped = (
-                df_merged.groupby("iso3")
-                .agg(
-                    {
-                        "stats_last_updated": "first",
-                        "max_adm_level": "first",
-                        "total-pcodes": "first",
-                        "year": "count",
-                        "total_rows": "sum",
-                        "unique_pcodes": "first",
-                    }
-                )
-                .reset_index()
-            )
-
-        # TODO -- Calculate expected vals dynamically based on current date
-        ds_factor = {"era5": 525, "seas5": 526 * 7, "imerg": 8690}
-        ds_date_updated = {
-            "era5": "2024-10-10",
-            "seas5": "2024-10-09",
-            "imerg": "2024-10-11",
-        }
-
-        df_grouped["total_rows_correct"] = (
-            ds_factor[dataset] * df_grouped["total-pcodes"]
-        )
-        # TODO -- Pull from DB instead of hard-coding
-        df_grouped["stats_last_updated"] = ds_date_updated[dataset]
-        df_dict = df_grouped.to_dict("records")
-        return df_dict, [df_dict[0]]
+        # Served from the background-refreshed snapshot in utils/summary.py
+        df_dict = get_completeness_records(dataset)
+        row_count = get_row_counts()[dataset]
+        return df_dict, [df_dict[0]], f"~{row_count:,} rows in {dataset}"
 
-    @app.callback(
+    @callback(
         Output("completeness-table-detail", "rowData"),
         Input("completeness-table", "selectedRows"),
         State("ds-dropdown", "value"),
     )
     def populate_detail_table(selected, dataset):
-        engine = get_engine(MODE)
-        query = text(
-            f"SELECT * FROM public.{dataset}_completeness WHERE iso3='{selected[0]['iso3']}'"  # noqa
-        )
-        with engine.connect() as con:
-            df = pd.read_sql_query(query, con)
-        return df.to_dict("records")
+        if not selected:
+            return dash.no_update
+        return get_completeness_detail(dataset, selected[0]["iso3"])
@@ -8,5 +8,52 @@ AZURE_DB_PW_DEV = os.getenv("AZURE_DB_PW_DEV")
 AZURE_DB_PW_PROD = os.getenv("AZURE_DB_PW_PROD")
 
 MODE = os.getenv("MODE", "dev")
+# Parquet snapshot read instead of Postgres when MODE=local
+LOCAL_DATA_DIR = os.getenv("LOCAL_DATA_DIR", "data/local")
 pwd = os.getenv("APP_PWD")
 uid = os.getenv("APP_UID")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Connection pool settings, shared by every query in a worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("EXPORT_STATEMENT_TIMEOUT_MS", 600000))
+# Disable when connecting through a transaction-pooling proxy such as PgBouncer
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true"
+
+# Query result cache: an in-memory LRU per worker backed by a shared disk tier
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", 64))
+CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))
+CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/raster-stats-cache")
+CACHE_DISK_MAX_ITEMS = int(os.getenv("CACHE_DISK_MAX_ITEMS", 512))
+# How often to re-read stats_last_updated from public.iso3
+CACHE_VERSION_TTL = int(os.getenv("CACHE_VERSION_TTL", 300))
+# Let workers wait on each other's identical queries through lock files in
+# CACHE_DIR, on top of the in-process single-flight
+CACHE_SHARED_LOCKS = os.getenv("CACHE_SHARED_LOCKS", "true").lower() == "true"
+
+# Stats derived from the pcode mean by utils/climatology.py, with their labels
+# in the stat dropdown. Kept here so building the layout does not import the
+# data layer
+ROLLING_WINDOW = 3
+DERIVED_STATS = {
+    "anomaly": "Anomaly (vs 1991-2020)",
+    "anomaly_rolling": f"Anomaly, {ROLLING_WINDOW}-step mean",
+    "percentile": "Percentile (vs 1991-2020)",
+}
+
+# How often the Database Summary snapshot is rebuilt in the background
+SUMMARY_REFRESH_SECONDS = int(os.getenv("SUMMARY_REFRESH_SECONDS", 900))
+
+# Background prefetch of the slices a user is likely to select next
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", 4))
+PREFETCH_QUEUE_SIZE = int(os.getenv("PREFETCH_QUEUE_SIZE", 32))
+# Slices warmed up by each worker after its first request: the most used ones
+# plus any listed here as comma-separated dataset:iso3:adm_level[:leadtime]
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 10))
+WARMUP_SLICES = os.getenv("WARMUP_SLICES", "")
@@ -3,6 +3,8 @@ from dash import dcc, html
 
 from utils.components import (
     chart_panel,
+    comparison_panel,
+    data_grid,
     mantine_sidebar_panel,
     navbar,
     database_completeness,
@@ -13,7 +15,6 @@ from utils.components import (
 def create_layout():
     return html.Div(
         [
-            dcc.Store(id="geojson-store"),
             dcc.Store(id="df-store"),
             navbar,
             html.Div(
@@ -33,29 +34,40 @@ def create_layout():
                                         [
                                             dmc.Tab("Charts", value="charts"),
                                             dmc.Tab("Selected Data", value="table"),
+                                            dmc.Tab("Compare", value="compare"),
                                             dmc.Tab("Database Summary", value="db"),
                                         ]
                                     ),
                                     dmc.TabsPanel([chart_panel()], value="charts"),
                                     dmc.TabsPanel(
                                         [
-                                            # dmc.Button(
-                                            #     style={"marginTop": "15px"},
-                                            #     children="Download as CSV",
-                                            #     variant="outline",
-                                            #     fullWidth=True,
-                                            #     id="csv-download",
-                                            # ),
+                                            html.A(
+                                                dmc.Button(
+                                                    style={"marginTop": "15px"},
+                                                    children="Download as CSV",
+                                                    variant="outline",
+                                                    fullWidth=True,
+                                                ),
+                                                id="csv-download",
+                                            ),
                                             dmc.LoadingOverlay(
                                                 html.Div(
+                                                    children=data_grid(),
                                                     id="grid",
                                                 )
                                             ),
                                         ],
                                         value="table",
                                     ),
+                                    dmc.TabsPanel(
+                                        [comparison_panel()], value="compare"
+                                    ),
                                     dmc.TabsPanel(
                                         [
+                                            dmc.Text(
+                                                id="db-row-count",
+                                                style={"margin": "10px 0"},
+                                            ),
                                             html.Div(
                                                 [
                                                     html.Div(
@@ -84,6 +96,7 @@ def create_layout():
                                         value="db",
                                     ),
                                 ],
+                                id="tabs",
                                 orientation="horizontal",
                                 value="charts",
                             ),
@@ -0,0 +1,149 @@
+"""Build the simplified boundary files read by utils/boundaries.py, and the
+low-zoom vector tiles served by utils/tiles.py.
+
+Run from the repository root after the raw GeoJSON in data/ changes:
+
+    python -m scripts.build_boundaries
+"""
+
+import glob
+import json
+import os
+import re
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from utils.boundaries import (
+    BOUNDARIES_DIR,
+    INDEX_PATH,
+    RAW_DIR,
+    TOLERANCES,
+    boundary_path,
+    index_key,
+    raw_path,
+    zoom_for_bbox,
+)
+from utils.tiles import (
+    PREBUILT_MAX_ZOOM,
+    TILES_DIR,
+    render_tile,
+    tile_path,
+    tiles_for_bbox,
+)
+
+
+def simplify(gdf, tolerance):
+    geometries = gdf.geometry.to_numpy()
+    if hasattr(shapely, "coverage_simplify"):
+        # Simplifies each shared edge once, so neighbouring units stay
+        # gap-free and never overlap
+        return shapely.coverage_simplify(geometries, tolerance)
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+def _polygons(geometry):
+    if geometry is None or geometry.is_empty:
+        return []
+    if geometry.geom_type == "Polygon":
+        return [geometry]
+    return [g for g in geometry.geoms if g.geom_type == "Polygon"]
+
+
+def _quantize_ring(ring, origin, scale):
+    q = np.round((np.asarray(ring.coords)[:, :2] - origin) / scale).astype(np.int64)
+    # Points that collapse onto the same grid cell carry no information
+    keep = np.ones(len(q), dtype=bool)
+    keep[1:] = np.any(q[1:] != q[:-1], axis=1)
+    q = q[keep]
+    return q if len(q) >= 4 else None
+
+
+def encode(geometries, properties, scale):
+    origin = np.array(shapely.total_bounds(geometries)[:2])
+    rings, ring_offsets, polygon_offsets, feature_offsets = [], [0], [0], [0]
+    for geometry in geometries:
+        for polygon in _polygons(geometry):
+            exterior = _quantize_ring(polygon.exterior, origin, scale)
+            if exterior is None:
+                continue
+            for ring in [exterior] + [
+                _quantize_ring(r, origin, scale) for r in polygon.interiors
+            ]:
+                if ring is not None:
+                    rings.append(ring)
+                    ring_offsets.append(ring_offsets[-1] + len(ring))
+            polygon_offsets.append(len(rings))
+        feature_offsets.append(len(polygon_offsets) - 1)
+
+    coords = np.concatenate(rings)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return {
+        "coords": deltas.astype(np.int32),
+        "ring_offsets": np.array(ring_offsets, dtype=np.int32),
+        "polygon_offsets": np.array(polygon_offsets, dtype=np.int32),
+        "feature_offsets": np.array(feature_offsets, dtype=np.int32),
+        "origin": origin,
+        "scale": np.float64(scale),
+        "properties": np.frombuffer(json.dumps(properties).encode(), dtype=np.uint8),
+    }
+
+
+def build_tiles(iso3, adm_level, bbox):
+    count = 0
+    for z in range(PREBUILT_MAX_ZOOM + 1):
+        for x, y in tiles_for_bbox(bbox, z):
+            tile = render_tile(iso3, adm_level, z, x, y)
+            if tile is None:
+                continue
+            path = tile_path(iso3, adm_level, z, x, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(tile)
+            count += 1
+    print(f"{iso3} adm{adm_level}: {count} tiles")
+
+
+def map_view(gdf):
+    centroid = shapely.union_all(gdf.geometry.to_numpy()).centroid
+    bbox = gdf.total_bounds.tolist()
+    return {
+        "center": {"lat": centroid.y, "lon": centroid.x},
+        "bbox": bbox,
+        "zoom": zoom_for_bbox(bbox),
+    }
+
+
+def build(iso3, adm_level):
+    gdf = gpd.read_file(raw_path(iso3, adm_level))
+    columns = [c for c in gdf.columns if c.endswith("_PCODE") or c.endswith("_EN")]
+    properties = gdf[columns].to_dict("records")
+    for tolerance in TOLERANCES:
+        geometries = simplify(gdf, tolerance)
+        # A grid a tenth of the tolerance keeps quantization error invisible
+        arrays = encode(geometries, properties, tolerance / 10)
+        path = boundary_path(iso3, adm_level, tolerance)
+        np.savez_compressed(path, **arrays)
+        print(f"{path}: {os.path.getsize(path) / 1024:.0f} KB")
+    view = map_view(gdf)
+    build_tiles(iso3, adm_level, view["bbox"])
+    return view
+
+
+def main():
+    os.makedirs(BOUNDARIES_DIR, exist_ok=True)
+    shutil.rmtree(TILES_DIR, ignore_errors=True)
+    index = {}
+    for path in sorted(glob.glob(os.path.join(RAW_DIR, "*_adm*.geojson"))):
+        match = re.match(r"([a-z]{3})_adm(\d)\.geojson", os.path.basename(path))
+        if match:
+            iso3, adm_level = match.group(1).upper(), int(match.group(2))
+            index[index_key(iso3, adm_level)] = build(iso3, adm_level)
+    with open(INDEX_PATH, "w") as f:
+        json.dump(index, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
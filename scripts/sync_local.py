@@ -0,0 +1,73 @@
+"""Snapshot Postgres into the local Parquet store read when MODE=local.
+
+Run from the repository root with MODE=dev (or prod) so the database is used:
+
+    python -m scripts.sync_local --iso3 AFG ETH --datasets era5 imerg
+
+Each (dataset, iso3, adm_level) slice is written, sorted by valid_date, to
+data/local/<dataset>/iso3=<ISO3>/adm_level=<n>/part-0.parquet, next to
+snapshots of the iso3 and *_completeness tables.
+"""
+
+import argparse
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.db import connect
+from utils.frames import compact_frame
+from utils.local_backend import partition_dir, table_path
+from utils.queries import (
+    DATASETS,
+    completeness_query,
+    iso3_query,
+    read_frame,
+    slice_params,
+    slice_query,
+)
+
+ROW_GROUP_SIZE = 50000
+
+
+def write_parquet(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+
+def sync_slice(con, dataset, iso3, adm_level):
+    params = slice_params(iso3, adm_level)
+    df = read_frame(con, slice_query(dataset), **params)
+    df.valid_date = pd.to_datetime(df.valid_date)
+    keys = ["valid_date", "leadtime", "pcode"]
+    df = compact_frame(df.sort_values([k for k in keys if k in df], ignore_index=True))
+    path = os.path.join(partition_dir(dataset, iso3, adm_level), "part-0.parquet")
+    write_parquet(df, path)
+    print(f"{path}: {len(df)} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS))
+    parser.add_argument("--iso3", nargs="+", help="Defaults to every country")
+    args = parser.parse_args()
+
+    with connect() as con:
+        df_iso3 = read_frame(con, iso3_query())
+        write_parquet(df_iso3, table_path("iso3"))
+        if args.iso3:
+            df_iso3 = df_iso3[df_iso3.iso3.isin([x.upper() for x in args.iso3])]
+        for dataset in args.datasets:
+            df_completeness = read_frame(con, completeness_query(dataset))
+            write_parquet(df_completeness, table_path(f"{dataset}_completeness"))
+            for row in df_iso3.itertuples():
+                for adm_level in range(int(row.max_adm_level) + 1):
+                    sync_slice(con, dataset, row.iso3, adm_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+
+# Settings are read when constants is imported, so they are set before any of
+# the app's modules are: no disk cache shared with a running app, and no
+# background prefetch adding queries of its own
+os.environ["MODE"] = "dev"
+os.environ["CACHE_DIR"] = ""
+os.environ["PREFETCH_ENABLED"] = "false"
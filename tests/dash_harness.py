@@ -0,0 +1,38 @@
+"""Calling the app's callbacks directly, without Dash's HTTP layer.
+
+Shared by the tests and the benchmarks, so Dash's private callback context is
+only reached into here.
+"""
+
+from contextlib import contextmanager
+
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+
+
+def collect_callbacks(app):
+    """The callbacks registered on app, undecorated, by function name."""
+    # The undecorated functions are kept by functools.wraps on Dash's wrapper
+    return {
+        spec["callback"].__wrapped__.__name__: spec["callback"].__wrapped__
+        for spec in app.callback_map.values()
+    }
+
+
+def set_triggered(*prop_ids):
+    """Set the callback context as Dash would for these triggering inputs."""
+    return context_value.set(
+        AttributeDict(
+            triggered_inputs=[{"prop_id": p, "value": None} for p in prop_ids]
+        )
+    )
+
+
+@contextmanager
+def triggered(*prop_ids):
+    """set_triggered for the duration of the block."""
+    token = set_triggered(*prop_ids)
+    try:
+        yield
+    finally:
+        context_value.reset(token)
@@ -0,0 +1,126 @@
+"""Database round trips per user action.
+
+The callbacks are called the way Dash chains them in the browser, against a
+stand-in for Postgres that returns a small synthetic slice, and the query
+counters in utils/queries.py are compared before and after each action.
+"""
+
+from contextlib import contextmanager
+
+import dash
+import numpy as np
+import pandas as pd
+import pytest
+from dash.exceptions import PreventUpdate
+
+from callbacks.callbacks import register_callbacks
+from tests.dash_harness import collect_callbacks, triggered
+from utils import data_processing, series
+from utils.queries import STATS, get_query_counts, stats_versions_query
+
+PCODES = ["P01", "P02", "P03"]
+DATES = pd.date_range("2020-01-01", periods=12, freq="MS")
+DATE = "2020-03-15"
+
+
+class FakeResult:
+    def all(self):
+        return []
+
+    def scalar(self):
+        return None
+
+
+class FakeConnection:
+    def __init__(self):
+        self.info = {}
+
+    def execute(self, statement, params=None):
+        return FakeResult()
+
+
+@contextmanager
+def fake_connect(mode=None):
+    yield FakeConnection()
+
+
+def fake_read_sql_query(sql, con, params=None):
+    # Every query gets the whole slice, the map only reads pcode and its stat
+    rows = [(pcode, date) for pcode in PCODES for date in DATES]
+    df = pd.DataFrame(rows, columns=["pcode", "valid_date"])
+    df.insert(0, "iso3", params["iso3"])
+    df.insert(1, "adm_level", params["adm_level"])
+    for stat in STATS:
+        df[stat] = np.arange(len(df), dtype="float64")
+    return df
+
+
+@pytest.fixture
+def callbacks(monkeypatch):
+    monkeypatch.setattr(data_processing, "connect", fake_connect)
+    monkeypatch.setattr(pd, "read_sql_query", fake_read_sql_query)
+    data_processing.query_cache.clear()
+    series._build_index.cache_clear()
+    app = dash.Dash(__name__)
+    register_callbacks(app)
+    return collect_callbacks(app)
+
+
+@contextmanager
+def db_hits():
+    """Queries sent to the database inside the block, by query name.
+
+    The stats_last_updated lookup is left out: it is shared by every action
+    and only re-read every CACHE_VERSION_TTL seconds.
+    """
+    hits = {}
+    before = get_query_counts()
+    yield hits
+    for name, count in get_query_counts().items():
+        if name != stats_versions_query().name and count > before.get(name, 0):
+            hits[name] = count - before.get(name, 0)
+
+
+def select_slice(callbacks, iso3, df_store):
+    # A dropdown change: the new handle fans out to the pcodes and the map,
+    # and the pcodes it selects to the line chart
+    handle = callbacks["update_data_store"](iso3, "1", "era5", None, df_store)
+    with triggered("df-store.data"):
+        pcodes = callbacks["update_pcodes"](handle)[1]
+        callbacks["update_charts"](handle, DATE, "mean", "inline")
+    with triggered("pcodes.value"):
+        callbacks["create_line_chart"](pcodes, DATE, "mean", handle)
+    return handle, pcodes
+
+
+def select_date(callbacks, handle, pcodes, date):
+    with triggered("date-picker.value"):
+        callbacks["update_charts"](handle, date, "mean", "inline")
+        callbacks["create_line_chart"](pcodes, date, "mean", handle)
+
+
+def test_iso3_change_fetches_slice_and_map_once(callbacks):
+    handle, _ = select_slice(callbacks, "ETH", None)
+    with db_hits() as hits:
+        select_slice(callbacks, "MDV", handle)
+    assert hits == {"slice_era5": 1, "map_era5_mean": 1}
+
+
+def test_date_change_fetches_map_only(callbacks):
+    handle, pcodes = select_slice(callbacks, "MDV", None)
+    with db_hits() as hits:
+        select_date(callbacks, handle, pcodes, "2020-06-15")
+    assert hits == {"map_era5_mean": 1}
+
+    # Going back to a date already shown is served from the cache
+    with db_hits() as hits:
+        select_date(callbacks, handle, pcodes, DATE)
+    assert hits == {}
+
+
+def test_unchanged_selection_stops_the_pipeline(callbacks):
+    handle, _ = select_slice(callbacks, "MDV", None)
+    with db_hits() as hits:
+        with pytest.raises(PreventUpdate):
+            callbacks["update_data_store"]("MDV", "1", "era5", None, handle)
+    assert hits == {}
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+
+RAW_DIR = "data"
+BOUNDARIES_DIR = "data/boundaries"
+INDEX_PATH = os.path.join(BOUNDARIES_DIR, "index.json")
+
+# Rough size of the map in the charts tab, used to fit a country's bbox
+MAP_WIDTH_PX = 900
+MAP_HEIGHT_PX = 550
+MAX_ZOOM = 10
+
+# Simplification tolerance (degrees) for the lowest zoom it is used at, about
+# half a pixel at that zoom so the simplification is not visible
+ZOOM_TOLERANCES = ((8, 0.001), (6, 0.005), (0, 0.02))
+TOLERANCES = tuple(tolerance for _, tolerance in ZOOM_TOLERANCES)
+
+
+def raw_path(iso3, adm_level):
+    return os.path.join(RAW_DIR, f"{iso3.lower()}_adm{adm_level}.geojson")
+
+
+@lru_cache(maxsize=None)
+def available_adm_levels(iso3):
+    levels = []
+    for name in os.listdir(RAW_DIR):
+        prefix = f"{iso3.lower()}_adm"
+        if name.startswith(prefix) and name.endswith(".geojson"):
+            levels.append(int(name[len(prefix) : -len(".geojson")]))
+    return tuple(sorted(levels))
+
+
+def boundary_path(iso3, adm_level, tolerance):
+    return os.path.join(
+        BOUNDARIES_DIR, f"{iso3.lower()}_adm{adm_level}_{tolerance:g}.npz"
+    )
+
+
+def tolerance_for_zoom(zoom):
+    for min_zoom, tolerance in ZOOM_TOLERANCES:
+        if zoom >= min_zoom:
+            return tolerance
+    return TOLERANCES[-1]
+
+
+def zoom_for_bbox(bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+
+    def mercator_y(lat):
+        lat = max(min(lat, 85.0), -85.0)
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    lon_span = max(max_lon - min_lon, 1e-6) / 360
+    lat_span = max(mercator_y(max_lat) - mercator_y(min_lat), 1e-6) / (2 * math.pi)
+    zoom_x = math.log2(MAP_WIDTH_PX / 256 / lon_span)
+    zoom_y = math.log2(MAP_HEIGHT_PX / 256 / lat_span)
+    # Leave a little margin around the country
+    zoom = min(zoom_x, zoom_y, MAX_ZOOM) - 0.25
+    return round(max(zoom, 0), 2)
+
+
+def _rings(geojson):
+    for feature in geojson["features"]:
+        geometry = feature["geometry"]
+        if geometry is None:
+            continue
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        else:
+            polygons = geometry["coordinates"]
+        for polygon in polygons:
+            for i, ring in enumerate(polygon):
+                yield i == 0, np.asarray(ring, dtype=np.float64)[:, :2]
+
+
+def compute_map_view(geojson):
+    # Area-weighted centroid of all polygons (holes subtract) and their bbox
+    area_sum, cx_sum, cy_sum = 0.0, 0.0, 0.0
+    mins, maxs = [], []
+    for is_exterior, ring in _rings(geojson):
+        x, y = ring[:, 0], ring[:, 1]
+        cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+        area = abs(cross.sum()) / 2
+        if area:
+            sign = 1 if is_exterior else -1
+            cx = ((x[:-1] + x[1:]) * cross).sum() / (3 * cross.sum())
+            cy = ((y[:-1] + y[1:]) * cross).sum() / (3 * cross.sum())
+            area_sum += sign * area
+            cx_sum += sign * area * cx
+            cy_sum += sign * area * cy
+        if is_exterior:
+            mins.append(ring.min(axis=0))
+            maxs.append(ring.max(axis=0))
+    bbox = [*np.min(mins, axis=0).tolist(), *np.max(maxs, axis=0).tolist()]
+    if area_sum:
+        lon, lat = cx_sum / area_sum, cy_sum / area_sum
+    else:
+        lon, lat = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+    return {
+        "center": {"lat": lat, "lon": lon},
+        "bbox": bbox,
+        "zoom": zoom_for_bbox(bbox),
+    }
+
+
+@lru_cache(maxsize=1)
+def _load_index():
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    with open(INDEX_PATH, "r") as f:
+        return json.load(f)
+
+
+def index_key(iso3, adm_level):
+    return f"{iso3.upper()}_{adm_level}"
+
+
+@lru_cache(maxsize=64)
+def get_map_view(iso3, adm_level):
+    """Center, bbox and zoom for a country at an admin level.
+
+    Comes from the index built by scripts/build_boundaries.py, or is computed
+    once from the boundaries if the index has not been built.
+    """
+    view = _load_index().get(index_key(iso3, adm_level))
+    if view is None:
+        view = compute_map_view(load_boundaries(iso3, adm_level, TOLERANCES[0]))
+    return view
+
+
+def _decode(path):
+    # Coordinates are stored as quantized integer deltas, so a single cumsum
+    # restores them for the whole file
+    with np.load(path) as npz:
+        scale = float(npz["scale"])
+        coords = np.cumsum(npz["coords"], axis=0, dtype=np.int64) * scale
+        coords += npz["origin"]
+        ring_offsets = npz["ring_offsets"].tolist()
+        polygon_offsets = npz["polygon_offsets"].tolist()
+        feature_offsets = npz["feature_offsets"].tolist()
+        properties = json.loads(npz["properties"].tobytes())
+
+    decimals = max(0, math.ceil(-math.log10(scale)))
+    points = np.round(coords, decimals).tolist()
+    rings = [points[i:j] for i, j in zip(ring_offsets, ring_offsets[1:])]
+    polygons = [rings[i:j] for i, j in zip(polygon_offsets, polygon_offsets[1:])]
+    features = [
+        {
+            "type": "Feature",
+            "properties": props,
+            "geometry": {"type": "MultiPolygon", "coordinates": polygons[i:j]},
+        }
+        for props, i, j in zip(properties, feature_offsets, feature_offsets[1:])
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+@lru_cache(maxsize=64)
+def load_boundaries(iso3, adm_level, tolerance=None):
+    """Boundaries for one country and admin level as a GeoJSON dict.
+
+    Reads the simplified file built by scripts/build_boundaries.py, falling
+    back to the raw GeoJSON if it has not been built. The result is shared
+    between callers and must not be modified.
+    """
+    tolerance = TOLERANCES[-1] if tolerance is None else tolerance
+    path = boundary_path(iso3, adm_level, tolerance)
+    if os.path.exists(path):
+        return _decode(path)
+    with open(raw_path(iso3, adm_level), "r") as f:
+        return json.load(f)
@@ -0,0 +1,265 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from utils.timing import record_cache
+
+_instances = weakref.WeakSet()
+# How often a worker waiting on another's lock file checks the disk tier
+SHARED_LOCK_POLL_SECONDS = 0.1
+# The disk tier is pruned at most this often per cache, not after every write
+DISK_PRUNE_SECONDS = 5
+
+
+class FrameCache:
+    """Bounded LRU/TTL cache of DataFrames with an optional shared disk tier.
+
+    The memory tier is private to each worker, the disk tier (Arrow IPC files)
+    is shared by every worker on the instance. Cached frames are handed out
+    as-is, so callers must not modify them in place.
+
+    get_or_fetch is single-flight: concurrent misses for the same key wait for
+    one fetch and share its result. With shared_locks the disk tier's lock
+    files extend this to every worker on the instance. Nobody waits longer
+    than wait_timeout seconds, the longest a fetch should ever take, on
+    another's fetch.
+    """
+
+    def __init__(
+        self,
+        max_items,
+        ttl,
+        disk_dir=None,
+        disk_max_items=None,
+        shared_locks=False,
+        wait_timeout=60,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_items = disk_max_items
+        self.shared_locks = shared_locks and bool(disk_dir)
+        self.wait_timeout = wait_timeout
+        self._items = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        self._stats = self._empty_stats()
+        _instances.add(self)
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def _empty_stats():
+        return {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.arrow")
+
+    def _count(self, name):
+        record_cache(name)
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_memory(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, df = item
+            if expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return df
+
+    def _set_memory(self, key, df):
+        with self._lock:
+            self._items[key] = (time.time() + self.ttl, df)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _get_disk(self, key):
+        if not self.disk_dir:
+            return None
+        # Arrow is only loaded once the disk tier is first used
+        import pyarrow.feather as feather
+
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            return feather.read_table(path, memory_map=True).to_pandas()
+        except (FileNotFoundError, OSError):
+            return None
+
+    def _set_disk(self, key, df):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        # Write to a temporary file first so other workers never read a
+        # partially written frame
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            df.reset_index(drop=True).to_feather(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            due = self._next_prune <= time.monotonic()
+            if due:
+                self._next_prune = time.monotonic() + DISK_PRUNE_SECONDS
+        if due:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Every worker prunes the same directory, so any file may already be
+        # gone by the time it is looked at
+        frames, locks = [], []
+        try:
+            with os.scandir(self.disk_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".arrow"):
+                        found = frames
+                    elif entry.name.endswith(".lock"):
+                        found = locks
+                    else:
+                        continue
+                    try:
+                        found.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        continue
+        except OSError:
+            return
+        frames.sort()
+        # Lock files are only removed long after any fetch holding them ended
+        now = time.time()
+        excess = len(frames) - (self.disk_max_items or len(frames))
+        for i, (mtime, path) in enumerate(frames + locks):
+            if i < excess or mtime + self.ttl < now:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, key):
+        df = self._get_memory(key)
+        if df is not None:
+            self._count("hits")
+            return df
+        df = self._get_disk(key)
+        if df is not None:
+            self._count("disk_hits")
+            self._set_memory(key, df)
+            return df
+        self._count("misses")
+        return None
+
+    def set(self, key, df):
+        self._set_memory(key, df)
+        self._set_disk(key, df)
+
+    def get_or_fetch(self, key, fetch):
+        df = self.get(key)
+        if df is not None:
+            return df
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = Future()
+        if not leader:
+            self._count("coalesced")
+            # The leader may itself wait up to wait_timeout on another worker
+            # before fetching
+            timeout = self.wait_timeout * (2 if self.shared_locks else 1)
+            try:
+                return flight.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise TimeoutError(
+                    f"Gave up after {timeout}s waiting on a fetch of {key!r}"
+                ) from None
+        try:
+            df = self._fetch_shared(key, fetch) if self.shared_locks else None
+            if df is None:
+                df = fetch()
+                self.set(key, df)
+            flight.set_result(df)
+            return df
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _fetch_shared(self, key, fetch):
+        # Workers missing the same key take turns on its lock file. The others
+        # poll the disk tier for the frame instead of blocking on the lock, and
+        # return None to fetch it themselves after wait_timeout
+        try:
+            lock = open(f"{self._path(key)}.lock", "w")
+        except OSError:
+            return None
+        deadline = time.monotonic() + self.wait_timeout
+        with lock:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    pass
+                df = self._get_disk(key)
+                if df is not None:
+                    self._count("coalesced")
+                    self._set_memory(key, df)
+                    return df
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(SHARED_LOCK_POLL_SECONDS)
+            # The previous holder may have just written it
+            df = self._get_disk(key)
+            if df is not None:
+                self._count("coalesced")
+                self._set_memory(key, df)
+                return df
+            df = fetch()
+            self.set(key, df)
+            return df
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """Lookups by result since this worker started, and the memory tier size.
+
+        Unlike the per-callback counts these include prefetch and warm-up.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["items"] = len(self._items)
+        return stats
+
+
+def _reset_after_fork():
+    # A fetch running in the parent at fork time never finishes in the child,
+    # so its waiters would block forever
+    for cache in list(_instances):
+        cache._lock = threading.Lock()
+        cache._in_flight = {}
+        cache._stats = cache._empty_stats()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
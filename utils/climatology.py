@@ -0,0 +1,182 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from constants import ROLLING_WINDOW
+from utils.data_processing import fetch_data_from_db, slice_version
+from utils.date_utils import DATASET_FREQUENCY
+
+# WMO standard normal period the anomalies are measured against
+BASELINE_START = np.datetime64("1991-01-01")
+BASELINE_END = np.datetime64("2020-12-31")
+# Derived stats are all computed from the pcode mean
+BASE_STAT = "mean"
+
+
+def _periods(dataset, dates):
+    # Calendar month for monthly datasets, calendar day for daily ones. Days
+    # are counted as in a non-leap year, with 29 February merged into the
+    # 28th, so leap years line up with every other year from March on
+    dates = pd.DatetimeIndex(dates)
+    if DATASET_FREQUENCY[dataset] == "daily":
+        days = dates.dayofyear.to_numpy() - 1
+        return days - (dates.is_leap_year & (days >= 59))
+    return dates.month.to_numpy() - 1
+
+
+def rolling_mean(values, window):
+    """Trailing mean over window steps, NaN until the window is full."""
+    values = np.asarray(values, dtype="float64")
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+    missing = np.isnan(values)
+    sums = np.cumsum(np.insert(np.where(missing, 0.0, values), 0, 0.0))
+    gaps = np.cumsum(np.insert(missing, 0, False))
+    window_sums = (sums[window:] - sums[:-window]) / window
+    # Windows with a missing value stay NaN
+    complete = gaps[window:] == gaps[:-window]
+    result[window - 1 :] = np.where(complete, window_sums, np.nan)
+    return result
+
+
+class Climatology:
+    """Per-pcode baseline of a slice's mean over 1991-2020, per calendar
+    month (or calendar day for daily data).
+
+    Means and the sorted baseline values are grouped with bincount and a
+    single sort, so anomalies and percentile ranks of any number of rows are
+    computed without a Python loop over pcodes.
+    """
+
+    def __init__(self, df, dataset):
+        self.dataset = dataset
+        self.n_periods = 365 if DATASET_FREQUENCY[dataset] == "daily" else 12
+        pcodes = pd.Categorical(df.pcode)
+        self.pcodes = pcodes.categories
+        dates = df.valid_date.to_numpy()
+        values = df[BASE_STAT].to_numpy(dtype="float64")
+        valid = (
+            (pcodes.codes >= 0)
+            & (dates >= BASELINE_START)
+            & (dates <= BASELINE_END)
+            & ~np.isnan(values)
+        )
+        groups = self._groups(pcodes.codes[valid], _periods(dataset, dates[valid]))
+        values = values[valid]
+
+        n_groups = len(self.pcodes) * self.n_periods
+        self.counts = np.bincount(groups, minlength=n_groups)
+        sums = np.bincount(groups, weights=values, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.means = sums / self.counts
+        self.starts = np.cumsum(self.counts) - self.counts
+
+        # Each group's values are scaled into [group, group + 1), so one
+        # searchsorted over all of them ranks every row within its own group
+        self.vmin = values.min() if len(values) else 0.0
+        self.span = max(values.max() - self.vmin, 1e-12) if len(values) else 1.0
+        self.keys = np.sort(groups + self._scale(values))
+
+    def _groups(self, codes, periods):
+        return codes.astype("int64") * self.n_periods + periods
+
+    def _scale(self, values):
+        return np.clip((values - self.vmin) / self.span, 0.0, 1.0 - 1e-9)
+
+    def _lookup(self, pcodes, dates):
+        codes = pd.Categorical(pcodes, categories=self.pcodes).codes
+        groups = self._groups(np.maximum(codes, 0), _periods(self.dataset, dates))
+        known = (codes >= 0) & (self.counts[groups] > 0)
+        return groups, known
+
+    def anomaly(self, pcodes, dates, values):
+        groups, known = self._lookup(pcodes, dates)
+        values = np.asarray(values, dtype="float64")
+        return np.where(known, values - self.means[groups], np.nan)
+
+    def percentile(self, pcodes, dates, values):
+        """Share (0-100) of the baseline at or below each value."""
+        groups, known = self._lookup(pcodes, dates)
+        values = np.asarray(values, dtype="float64")
+        keys = groups + self._scale(values)
+        rank = np.searchsorted(self.keys, keys, side="right") - self.starts[groups]
+        counts = np.maximum(self.counts[groups], 1)
+        return np.where(known & ~np.isnan(values), 100.0 * rank / counts, np.nan)
+
+    def derive(self, stat, pcodes, dates, values):
+        if stat == "percentile":
+            return self.percentile(pcodes, dates, values)
+        return self.anomaly(pcodes, dates, values)
+
+
+@lru_cache(maxsize=32)
+def _build_climatology(dataset, iso3, adm_level, lt, version):
+    return Climatology(fetch_data_from_db(iso3, adm_level, dataset, lt), dataset)
+
+
+def get_climatology(handle):
+    # Baselines only change when the pipeline rewrites the country's stats
+    return _build_climatology(
+        handle["dataset"],
+        handle["iso3"],
+        str(handle["adm_level"]),
+        handle["lt"] or None,
+        slice_version(handle["iso3"]),
+    )
+
+
+def _calendar_rolling_mean(dataset, dates, values):
+    # Dates missing from the series count as gaps, like missing values, so a
+    # window never reaches back past them. fetch_derived_map applies the same
+    # rule to the map
+    if not len(dates):
+        return values
+    freq = "D" if DATASET_FREQUENCY[dataset] == "daily" else "MS"
+    series = pd.Series(values, index=pd.DatetimeIndex(dates))
+    steps = series.reindex(pd.date_range(series.index[0], series.index[-1], freq=freq))
+    rolled = pd.Series(rolling_mean(steps.to_numpy(), ROLLING_WINDOW), steps.index)
+    return rolled.reindex(series.index).to_numpy()
+
+
+def derived_series(handle, pcode, dates, values, stat):
+    """A derived stat along one pcode's time series of BASE_STAT values."""
+    clim = get_climatology(handle)
+    derived = clim.derive(stat, np.repeat(pcode, len(dates)), dates, values)
+    if stat == "anomaly_rolling":
+        return _calendar_rolling_mean(handle["dataset"], dates, derived)
+    return derived
+
+
+def fetch_derived_map(handle, date, stat):
+    """A derived stat for every pcode on one date, as fetch_map_data returns."""
+    df = fetch_data_from_db(
+        handle["iso3"], handle["adm_level"], handle["dataset"], handle["lt"]
+    )
+    end = pd.Timestamp(date)
+    start = end
+    if stat == "anomaly_rolling":
+        if DATASET_FREQUENCY[handle["dataset"]] == "daily":
+            start = end - pd.DateOffset(days=ROLLING_WINDOW - 1)
+        else:
+            start = end - pd.DateOffset(months=ROLLING_WINDOW - 1)
+    # Slices are sorted by valid_date, so the rows are one contiguous block
+    dates = df.valid_date.to_numpy()
+    lo = np.searchsorted(dates, start.to_datetime64(), side="left")
+    hi = np.searchsorted(dates, end.to_datetime64(), side="right")
+    rows = df.iloc[lo:hi]
+    derived = get_climatology(handle).derive(
+        stat,
+        rows.pcode.to_numpy(),
+        rows.valid_date.to_numpy(),
+        rows[BASE_STAT].to_numpy(),
+    )
+    result = pd.DataFrame({"pcode": rows.pcode.to_numpy(), stat: derived})
+    grouped = result.groupby("pcode", observed=True)[stat]
+    if stat == "anomaly_rolling":
+        # As on the line chart, only pcodes with a value on every step of the
+        # window get one
+        complete = grouped.count() == ROLLING_WINDOW
+        return grouped.mean().where(complete).reset_index()
+    return grouped.mean().reset_index()
@@ -3,8 +3,11 @@ from datetime import date
 import dash_ag_grid as dag
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
+import pandas as pd
 from dash import dcc, html
 
+from constants import DERIVED_STATS
+
 navbar = dbc.NavbarSimple(
     children=[
         dbc.NavItem(
@@ -21,17 +24,30 @@ navbar = dbc.NavbarSimple(
 )
 
 
-def data_grid(df):
+def _column_def(name, dtype):
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return {"field": name, "filter": "agDateColumnFilter"}
+    if pd.api.types.is_numeric_dtype(dtype):
+        return {"field": name, "filter": "agNumberColumnFilter"}
+    return {"field": name, "filter": "agTextColumnFilter"}
+
+
+def data_grid(df=None):
+    # Rows are requested block by block from the server (see utils/grid.py),
+    # only the column types are needed to build the grid
+    columns = df.dtypes.items() if df is not None else []
     return dag.AgGrid(
         id="ag-grid-table",
-        rowData=df.to_dict("records"),
-        defaultColDef={"filter": True},
-        csvExportParams={
-            "fileName": "demo-export.csv",
-        },
-        columnDefs=[{"field": i} for i in df.columns],
+        rowModelType="infinite",
+        defaultColDef={"filter": True, "sortable": True},
+        columnDefs=[_column_def(name, dtype) for name, dtype in columns],
         style={"height": 600},
-        dashGridOptions={"pagination": True, "paginationAutoPageSize": True},
+        dashGridOptions={
+            "pagination": True,
+            "paginationAutoPageSize": True,
+            "cacheBlockSize": 100,
+            "maxBlocksInCache": 10,
+        },
         className="ag-theme-material",
     )
 
@@ -59,6 +75,10 @@ def mantine_sidebar_panel():
                     "count",
                     "sum",
                     "std",
+                    *[
+                        {"value": stat, "label": label}
+                        for stat, label in DERIVED_STATS.items()
+                    ],
                 ],
                 style={"width": 200, "marginBottom": 10},
             ),
@@ -117,6 +137,16 @@ def chart_panel():
                     style={"height": "150px"},
                 )
             ),
+            dmc.SegmentedControl(
+                id="map-mode",
+                value="tiles",
+                data=[
+                    {"label": "Vector tiles", "value": "tiles"},
+                    {"label": "Inline GeoJSON", "value": "inline"},
+                ],
+                size="xs",
+                style={"margin": "10px 0"},
+            ),
             dmc.LoadingOverlay(
                 dcc.Graph(
                     id="map",
@@ -130,6 +160,51 @@ def chart_panel():
     )
 
 
+def comparison_panel():
+    return html.Div(
+        [
+            html.Div(
+                [
+                    dmc.MultiSelect(
+                        id="compare-iso3",
+                        label="Countries to compare",
+                        data=["AFG", "ETH", "MDV", "BRA"],
+                        value=["AFG", "ETH"],
+                        style={"width": 300},
+                    ),
+                    dmc.DateRangePicker(
+                        id="compare-dates",
+                        label="Valid dates",
+                        minDate=date(1981, 1, 1),
+                        value=[date(2020, 1, 1), date(2020, 3, 1)],
+                        style={"width": 300},
+                    ),
+                ],
+                style={"display": "flex", "gap": "20px", "margin": "15px 0"},
+            ),
+            dmc.LoadingOverlay(
+                html.Div(
+                    id="compare-maps",
+                    style={
+                        "display": "grid",
+                        "gridTemplateColumns": "repeat(auto-fill, minmax(300px, 1fr))",
+                        "gap": "10px",
+                    },
+                )
+            ),
+        ]
+    )
+
+
+def comparison_map(title, figure):
+    return html.Div(
+        [
+            dmc.Text(title, size="sm", weight=500),
+            dcc.Graph(figure=figure, style={"height": "300px"}),
+        ]
+    )
+
+
 def database_completeness():
 
     column_defs = [
@@ -1,8 +1,15 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 
+# First valid_date of each dataset, how often it has a value and how many
+# leadtimes are stored per valid_date
+DATASET_START = {"era5": "1981-01-01", "seas5": "1981-01-01", "imerg": "2000-06-01"}
+DATASET_FREQUENCY = {"era5": "monthly", "seas5": "monthly", "imerg": "daily"}
+DATASET_LEADTIMES = {"era5": 1, "seas5": 7, "imerg": 1}
+
 
 def display_date_range(dataset, date):
     if dataset == "imerg":
@@ -18,3 +25,40 @@ def to_first_of_month(date_string):
     date = datetime.strptime(date_string, "%Y-%m-%d")
     first_of_month = date.replace(day=1)
     return first_of_month.strftime("%Y-%m-%d")
+
+
+def dates_between(dataset, start, end):
+    """The dataset's valid_dates in [start, end], as YYYY-MM-DD strings."""
+    if DATASET_FREQUENCY[dataset] == "monthly":
+        start = to_first_of_month(str(start)[:10])
+    freq = "D" if DATASET_FREQUENCY[dataset] == "daily" else "MS"
+    return pd.date_range(start, end, freq=freq).strftime("%Y-%m-%d").tolist()
+
+
+def _date_parts(values):
+    values = pd.to_datetime(values)
+    return values.dt if isinstance(values, pd.Series) else values
+
+
+def count_dates(dataset, start, end):
+    """Number of valid_dates (times leadtimes) a dataset has in [start, end].
+
+    start and end can be scalars or aligned Series, so a whole table of date
+    ranges is counted in one vectorized pass.
+    """
+    start, end = _date_parts(start), _date_parts(end)
+    if DATASET_FREQUENCY[dataset] == "daily":
+        n_dates = (end.normalize() - start.normalize()) // pd.Timedelta(days=1) + 1
+    else:
+        # Monthly values are stored on the first of the month
+        n_dates = (
+            (end.year - start.year) * 12
+            + (end.month - start.month)
+            + (start.day == 1) * 1
+        )
+    return np.maximum(n_dates, 0) * DATASET_LEADTIMES[dataset]
+
+
+def expected_rows(dataset, n_pcodes, end, start=None):
+    start = DATASET_START[dataset] if start is None else start
+    return count_dates(dataset, start, end) * n_pcodes
@@ -0,0 +1,281 @@
+import io
+import queue
+import threading
+from datetime import date
+from functools import lru_cache
+from urllib.parse import urlencode
+
+import pandas as pd
+from flask import Response, abort, request, stream_with_context
+
+from constants import EXPORT_STATEMENT_TIMEOUT_MS, MODE
+from utils.data_processing import load_data_handle, make_data_handle
+from utils.db import get_engine
+from utils.queries import DATASETS, STATS, count_query, export_sql
+
+EXPORT_CHUNK_ROWS = 50000
+MIMETYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+@lru_cache(maxsize=None)
+def _pg_arrow_types():
+    # Arrow types of the Postgres columns an export can contain, by type OID.
+    # Anything else is written as text
+    import pyarrow as pa
+
+    return {
+        16: pa.bool_(),
+        20: pa.int64(),
+        21: pa.int16(),
+        23: pa.int32(),
+        25: pa.string(),
+        700: pa.float32(),
+        701: pa.float64(),
+        1042: pa.string(),
+        1043: pa.string(),
+        1082: pa.date32(),
+        1114: pa.timestamp("us"),
+        1184: pa.timestamp("us", tz="UTC"),
+        1700: pa.float64(),
+    }
+
+
+def export_url(handle, fmt="csv"):
+    params = {key: value for key, value in handle.items() if value is not None}
+    return f"/export/{fmt}?{urlencode(params)}"
+
+
+class _QueueWriter(io.RawIOBase):
+    """File-like target for COPY that hands each chunk to the response
+    generator, blocking when the client is slower than the database."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.cancelled = threading.Event()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise IOError("Export cancelled by client")
+        self.chunks.put(bytes(data))
+        return len(data)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Parquet output that can be drained after each row group while still
+    reporting the absolute position the writer needs for the footer."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _raw_connection():
+    con = get_engine().raw_connection()
+    # Exports can outlive the normal statement timeout. SET LOCAL only lasts
+    # until the pool rolls the transaction back when the connection returns
+    with con.cursor() as cur:
+        cur.execute(f"SET LOCAL statement_timeout = {EXPORT_STATEMENT_TIMEOUT_MS}")
+    return con
+
+
+def _stream_copy(sql, params):
+    con = _raw_connection()
+    chunks = queue.Queue(maxsize=16)
+    writer = _QueueWriter(chunks)
+    done = object()
+
+    def run():
+        try:
+            with con.cursor() as cur:
+                copy = cur.mogrify(sql, params).decode()
+                cur.copy_expert(f"COPY ({copy}) TO STDOUT WITH CSV HEADER", writer)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            con.close()
+            chunks.put(done)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # Stops COPY early if the client went away, then lets it finish
+        writer.cancelled.set()
+        while thread.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _arrow_schema(description):
+    # Taken from the cursor rather than the first chunk, so an empty export or
+    # a column that starts with nulls still gets the column's real type
+    import pyarrow as pa
+
+    types = _pg_arrow_types()
+    return pa.schema(
+        [
+            pa.field(column.name, types.get(column.type_code, pa.string()))
+            for column in description
+        ]
+    )
+
+
+def _iter_frames(cur, rows, columns):
+    while rows:
+        # coerce_float turns numeric columns' Decimals into floats
+        yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+
+
+def _iter_db_parquet(sql, params):
+    con = _raw_connection()
+    try:
+        # A named cursor keeps the result on the server, only one chunk of
+        # rows is held in memory at a time
+        with con.cursor(name="export") as cur:
+            cur.itersize = EXPORT_CHUNK_ROWS
+            cur.execute(sql, params)
+            # Named cursors only describe their columns once a fetch has run,
+            # which they do even when it returns no rows
+            rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+            columns = [column.name for column in cur.description]
+            yield from _iter_parquet(
+                _iter_frames(cur, rows, columns), _arrow_schema(cur.description)
+            )
+    finally:
+        con.close()
+
+
+def _local_slice(handle, stats, start, end):
+    df = load_data_handle(handle)
+    if start is not None:
+        df = df[df.valid_date >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df.valid_date <= pd.Timestamp(end)]
+    if stats:
+        df = df[[c for c in df.columns if c not in STATS or c in stats]]
+    return df
+
+
+def _iter_chunks(df):
+    # At least one chunk, so an empty CSV still has its header
+    for i in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+        yield df.iloc[i : i + EXPORT_CHUNK_ROWS]
+
+
+def _iter_csv(frames):
+    for i, df in enumerate(frames):
+        yield df.to_csv(index=False, header=i == 0)
+
+
+def _iter_local_parquet(df):
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    yield from _iter_parquet(_iter_chunks(df), schema)
+
+
+def _iter_parquet(frames, schema):
+    # Only loaded for the first Parquet export rather than by every worker
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    # Opened before the first row, so the schema and footer are written even
+    # when the slice is empty and the result is always a valid file
+    with pq.ParquetWriter(sink, schema) as writer:
+        for df in frames:
+            if len(df):
+                table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+                writer.write_table(table)
+                yield sink.drain()
+    yield sink.drain()
+
+
+def _parse_args(args):
+    try:
+        dataset = args["dataset"]
+        iso3 = args["iso3"].upper()
+        adm_level = int(args.get("adm_level", 0))
+        lt = int(args["lt"]) if args.get("lt") else None
+        start = date.fromisoformat(args["start"]) if args.get("start") else None
+        end = date.fromisoformat(args["end"]) if args.get("end") else None
+    except (KeyError, ValueError):
+        abort(400)
+    stats = [stat for stat in args.get("stats", "").split(",") if stat]
+    if dataset not in DATASETS or any(stat not in STATS for stat in stats):
+        abort(400)
+    # Ends up in the download's filename and, in local mode, in a file path
+    if len(iso3) != 3 or not (iso3.isascii() and iso3.isalpha()):
+        abort(400)
+    return dataset, iso3, adm_level, lt, start, end, stats
+
+
+def register_routes(server):
+    @server.route("/export/<fmt>")
+    def export_slice(fmt):
+        """Stream a slice as CSV or Parquet, e.g.
+
+        /export/parquet?dataset=seas5&iso3=AFG&adm_level=1&lt=0
+            &start=2000-01-01&end=2020-12-01&stats=mean,max
+        """
+        if fmt not in MIMETYPES:
+            abort(404)
+        dataset, iso3, adm_level, lt, start, end, stats = _parse_args(request.args)
+
+        if MODE == "local":
+            handle = make_data_handle(iso3, adm_level, dataset, lt)
+            df = _local_slice(handle, stats, start, end)
+            if fmt == "csv":
+                body = _iter_csv(_iter_chunks(df))
+            else:
+                body = _iter_local_parquet(df)
+        else:
+            sql = export_sql(dataset, stats, lt, start, end)
+            params = {
+                "iso3": iso3,
+                "adm_level": adm_level,
+                "leadtime": lt,
+                "start": start,
+                "end": end,
+            }
+            count_query(f"export_{dataset}")
+            if fmt == "csv":
+                body = _stream_copy(sql, params)
+            else:
+                body = _iter_db_parquet(sql, params)
+
+        filename = f"{dataset}_{iso3}_adm{adm_level}.{fmt}"
+        return Response(
+            stream_with_context(body),
+            mimetype=MIMETYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
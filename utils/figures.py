@@ -0,0 +1,142 @@
+import plotly.graph_objects as go
+from dash import Patch
+
+
+def feature_pcodes(geojson, adm_level):
+    key = f"ADM{adm_level}_PCODE"
+    return [feature["properties"][key] for feature in geojson["features"]]
+
+
+def _map_values(df, stat, locations):
+    # Aligned with the figure's locations, so a patch can swap z in place
+    values = df.groupby("pcode", observed=True)[stat].first().reindex(locations)
+    z = values.astype(object).where(values.notna(), None).tolist()
+    valid = values.dropna()
+    if valid.empty:
+        return z, None, None
+    return z, float(valid.min()), float(valid.max())
+
+
+def _coloraxis(stat, zmin, zmax):
+    colorscale = "Blues"
+    if stat.startswith("anomaly") and zmin is not None:
+        # Diverging around zero, so dry and wet anomalies read the same way
+        colorscale = "RdBu"
+        zmax = max(abs(zmin), abs(zmax))
+        zmin = -zmax
+    return {
+        "colorscale": colorscale,
+        "cmin": zmin,
+        "cmax": zmax,
+        "colorbar": {"title": {"text": stat}},
+    }
+
+
+def _outline_layer(tiles_url):
+    return {
+        "sourcetype": "vector",
+        "source": [tiles_url],
+        "sourcelayer": "boundaries",
+        "type": "line",
+        "color": "#444444",
+        "line": {"width": 0.8},
+    }
+
+
+def choropleth_figure(
+    df, stat, geojson, adm_level, view, zrange=None, geojson_url=None, tiles_url=None
+):
+    # zrange fixes the color scale, e.g. so small multiples can be compared.
+    # With the URLs set, the browser fetches and caches the fill geometry and
+    # draws the outlines from vector tiles, so the figure only carries values
+    locations = feature_pcodes(geojson, adm_level)
+    z, zmin, zmax = _map_values(df, stat, locations)
+    if zrange is not None:
+        zmin, zmax = zrange
+    fig = go.Figure(
+        go.Choroplethmap(
+            geojson=geojson_url or geojson,
+            locations=locations,
+            z=z,
+            featureidkey=f"properties.ADM{adm_level}_PCODE",
+            coloraxis="coloraxis",
+            marker={"opacity": 0.5, "line": {"width": 0 if tiles_url else 1}},
+            hovertemplate=f"pcode=%{{location}}<br>{stat}=%{{z}}<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        map={
+            "style": "carto-positron",
+            "zoom": view["zoom"],
+            "center": view["center"],
+            "layers": [_outline_layer(tiles_url)] if tiles_url else [],
+        },
+        coloraxis=_coloraxis(stat, zmin, zmax),
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+    )
+    return fig
+
+
+def choropleth_patch(df, stat, geojson, adm_level):
+    # Only the values and color range change, the geometry already in the
+    # browser is left alone
+    z, zmin, zmax = _map_values(df, stat, feature_pcodes(geojson, adm_level))
+    patched = Patch()
+    patched["data"][0]["z"] = z
+    patched["data"][0]["hovertemplate"] = (
+        f"pcode=%{{location}}<br>{stat}=%{{z}}<extra></extra>"
+    )
+    patched["layout"]["coloraxis"] = _coloraxis(stat, zmin, zmax)
+    return patched
+
+
+def _date_band(date_range):
+    return {
+        "type": "rect",
+        "xref": "x",
+        "yref": "y domain",
+        "x0": date_range[0],
+        "x1": date_range[1],
+        "y0": 0,
+        "y1": 1,
+        "opacity": 0.2,
+        "fillcolor": "red",
+        "line": {"color": "red", "width": 5},
+    }
+
+
+def line_figure(series, stat, date_range):
+    # series maps each pcode to its dates and values
+    fig = go.Figure()
+    for pcode, (dates, values) in series.items():
+        fig.add_trace(
+            go.Scatter(
+                x=dates,
+                y=values,
+                mode="lines",
+                name=pcode,
+                hovertemplate=(
+                    f"pcode={pcode}<br>valid_date=%{{x}}<br>{stat}=%{{y}}"
+                    "<extra></extra>"
+                ),
+            )
+        )
+    # The date band is always the first shape, so a date change can patch it
+    # without resending the traces
+    fig.update_layout(
+        template="simple_white",
+        margin={"r": 0, "t": 15, "l": 0, "b": 0},
+        xaxis_title="",
+        yaxis_title=stat,
+        legend_title_text="pcode",
+        showlegend=True,
+        shapes=[_date_band(date_range)],
+    )
+    return fig
+
+
+def date_band_patch(date_range):
+    patched = Patch()
+    patched["layout"]["shapes"][0]["x0"] = date_range[0]
+    patched["layout"]["shapes"][0]["x1"] = date_range[1]
+    return patched
@@ -0,0 +1,26 @@
+import pandas as pd
+
+CATEGORY_COLUMNS = ("iso3", "pcode")
+SMALL_INT_COLUMNS = ("adm_level", "leadtime")
+# Stats whose values are fine with float32's ~7 significant digits. sum and
+# count can get large, so they keep their original dtype
+FLOAT32_STATS = ("mean", "median", "max", "min", "std")
+
+
+def compact_frame(df):
+    """Shrink a fetched stats frame: categoricals for the repeated codes, int8
+    for levels and leadtimes, float32 for stats and Arrow-backed strings for
+    any other text. Returns a new frame."""
+    columns = {}
+    for name, series in df.items():
+        if name in CATEGORY_COLUMNS:
+            columns[name] = series.astype("category")
+        elif name in SMALL_INT_COLUMNS and series.notna().all():
+            columns[name] = series.astype("int8")
+        elif name in FLOAT32_STATS and pd.api.types.is_float_dtype(series):
+            columns[name] = series.astype("float32")
+        elif series.dtype == object and name != "valid_date":
+            columns[name] = series.astype("string[pyarrow]")
+        else:
+            columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
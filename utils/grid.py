@@ -0,0 +1,81 @@
+import pandas as pd
+
+TEXT_FILTERS = {
+    "contains": lambda s, v: s.str.contains(v, case=False, regex=False),
+    "notContains": lambda s, v: ~s.str.contains(v, case=False, regex=False),
+    "equals": lambda s, v: s.str.lower() == v.lower(),
+    "notEqual": lambda s, v: s.str.lower() != v.lower(),
+    "startsWith": lambda s, v: s.str.lower().str.startswith(v.lower()),
+    "endsWith": lambda s, v: s.str.lower().str.endswith(v.lower()),
+}
+
+RANGE_FILTERS = {
+    "equals": lambda s, v, _: s == v,
+    "notEqual": lambda s, v, _: s != v,
+    "lessThan": lambda s, v, _: s < v,
+    "lessThanOrEqual": lambda s, v, _: s <= v,
+    "greaterThan": lambda s, v, _: s > v,
+    "greaterThanOrEqual": lambda s, v, _: s >= v,
+    "inRange": lambda s, v, to: (s >= v) & (s <= to),
+}
+
+
+def _condition_mask(series, condition):
+    kind = condition.get("type")
+    if kind == "blank":
+        return series.isna()
+    if kind == "notBlank":
+        return series.notna()
+    filter_type = condition.get("filterType")
+    if filter_type == "number":
+        fn = RANGE_FILTERS[kind]
+        return fn(series, condition.get("filter"), condition.get("filterTo"))
+    if filter_type == "date":
+        fn = RANGE_FILTERS[kind]
+        date_to = condition.get("dateTo")
+        return fn(
+            series,
+            pd.to_datetime(condition.get("dateFrom")),
+            pd.to_datetime(date_to) if date_to else None,
+        )
+    fn = TEXT_FILTERS[kind]
+    return fn(series.astype(str), str(condition.get("filter", ""))).fillna(False)
+
+
+def apply_filter_model(df, filter_model):
+    mask = pd.Series(True, index=df.index)
+    for column, model in (filter_model or {}).items():
+        if column not in df.columns:
+            continue
+        series = df[column]
+        if "conditions" in model:
+            masks = [_condition_mask(series, c) for c in model["conditions"]]
+            combined = masks[0]
+            for m in masks[1:]:
+                combined = combined | m if model["operator"] == "OR" else combined & m
+            mask &= combined
+        else:
+            mask &= _condition_mask(series, model)
+    return df[mask]
+
+
+def apply_sort_model(df, sort_model):
+    sort_model = [s for s in sort_model or [] if s["colId"] in df.columns]
+    if not sort_model:
+        return df
+    return df.sort_values(
+        [s["colId"] for s in sort_model],
+        ascending=[s["sort"] == "asc" for s in sort_model],
+        kind="stable",
+    )
+
+
+def get_rows(df, request):
+    """Answer an AgGrid infinite row model getRowsRequest from a frame."""
+    df = apply_sort_model(
+        apply_filter_model(df, request.get("filterModel")), request.get("sortModel")
+    )
+    block = df.iloc[request["startRow"] : request["endRow"]].copy()
+    for column in block.select_dtypes("datetime").columns:
+        block[column] = block[column].dt.strftime("%Y-%m-%d")
+    return {"rowData": block.to_dict("records"), "rowCount": len(df)}
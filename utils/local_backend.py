@@ -0,0 +1,97 @@
+import os
+from datetime import date
+from functools import lru_cache
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+
+from constants import LOCAL_DATA_DIR
+from utils.queries import table_name
+from utils.timing import stage
+
+# Memory-mapped reads, so Arrow buffers point straight into the page cache
+_filesystem = fs.LocalFileSystem(use_mmap=True)
+
+
+def partition_dir(dataset, iso3, adm_level):
+    table_name(dataset)
+    return os.path.join(
+        LOCAL_DATA_DIR, dataset, f"iso3={iso3.upper()}", f"adm_level={int(adm_level)}"
+    )
+
+
+def table_path(name):
+    # Small whole tables (iso3, *_completeness) are stored as single files
+    table_name(name)
+    return os.path.join(LOCAL_DATA_DIR, f"{name}.parquet")
+
+
+def _to_date(value):
+    return date.fromisoformat(str(value)[:10])
+
+
+def _scan(dataset, iso3, adm_level, lt=None, start=None, end=None, columns=None):
+    path = partition_dir(dataset, iso3, adm_level)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(
+            f"No local data for {dataset} {iso3} adm{adm_level}, "
+            "run python -m scripts.sync_local"
+        )
+    # Files are sorted by valid_date, so the date filter skips whole row
+    # groups using the Parquet statistics
+    expression = None
+    filters = []
+    if lt is not None:
+        filters.append(ds.field("leadtime") == int(lt))
+    if start is not None:
+        filters.append(ds.field("valid_date") >= pd.Timestamp(_to_date(start)))
+    if end is not None:
+        filters.append(ds.field("valid_date") <= pd.Timestamp(_to_date(end)))
+    for f in filters:
+        expression = f if expression is None else expression & f
+    with stage("scan"):
+        dataset_ = ds.dataset(path, format="parquet", filesystem=_filesystem)
+        return dataset_.to_table(columns=columns, filter=expression)
+
+
+@lru_cache(maxsize=16)
+def fetch_slice(iso3, adm_level, dataset, lt=None):
+    """Local equivalent of fetch_data_from_db. The result is shared between
+    callers and must not be modified."""
+    df = _scan(dataset, iso3, adm_level, lt=lt).to_pandas()
+    return df.sort_values("valid_date", ascending=True, ignore_index=True)
+
+
+def fetch_map(iso3, adm_level, dataset, valid_date, stat, lt=None):
+    table = _scan(
+        dataset,
+        iso3,
+        adm_level,
+        lt=lt,
+        start=valid_date,
+        end=valid_date,
+        columns=["pcode", stat],
+    )
+    return table.to_pandas()
+
+
+def read_table(name):
+    return pd.read_parquet(table_path(name), filesystem=_filesystem)
+
+
+def latest_date(dataset):
+    # Latest issue month for seas5, as in utils.queries.latest_date_query
+    root = os.path.join(LOCAL_DATA_DIR, dataset)
+    dataset_ = ds.dataset(root, format="parquet", filesystem=_filesystem)
+    expression = ds.field("leadtime") == 0 if dataset == "seas5" else None
+    table = dataset_.to_table(columns=["valid_date"], filter=expression)
+    return pc.max(table["valid_date"]).as_py()
+
+
+def count_rows(dataset):
+    # Answered from the Parquet footers without reading any data
+    root = os.path.join(LOCAL_DATA_DIR, dataset)
+    dataset_ = ds.dataset(root, format="parquet", filesystem=_filesystem)
+    return dataset_.count_rows()
@@ -0,0 +1,247 @@
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context
+
+from utils.data_processing import query_cache
+from utils.db import get_pool_stats
+from utils.queries import get_query_counts
+from utils.timing import collect
+
+# Upper bounds (seconds) of the callback duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Stages timed explicitly, whatever else a callback spends is counted as pandas
+TIMED_STAGES = ("sql", "scan", "figure")
+
+_lock = threading.Lock()
+
+
+def _empty_metrics():
+    return {
+        "calls": defaultdict(int),
+        "status": defaultdict(int),
+        "buckets": defaultdict(lambda: [0] * (len(BUCKETS) + 1)),
+        "seconds": defaultdict(float),
+        "stage_seconds": defaultdict(float),
+        "payload_bytes": defaultdict(int),
+        "cache": defaultdict(int),
+    }
+
+
+_metrics = _empty_metrics()
+
+
+def _observe(name, timings, seconds, status):
+    stages = timings["stages"]
+    stages["pandas"] = max(seconds - sum(stages[s] for s in TIMED_STAGES), 0.0)
+    bucket = next((i for i, le in enumerate(BUCKETS) if seconds <= le), len(BUCKETS))
+    with _lock:
+        _metrics["calls"][name] += 1
+        _metrics["status"][name, status] += 1
+        _metrics["seconds"][name] += seconds
+        _metrics["buckets"][name][bucket] += 1
+        for stage_name, value in stages.items():
+            _metrics["stage_seconds"][name, stage_name] += value
+        for result in timings["cache"]:
+            _metrics["cache"][name, result] += 1
+
+
+def _timed(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        status = "ok"
+        start = time.perf_counter()
+        with collect() as timings:
+            try:
+                return fn(*args, **kwargs)
+            except PreventUpdate:
+                status = "prevented"
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                _observe(fn.__name__, timings, seconds, status)
+                if has_request_context():
+                    # Finished off by _after_request once Dash has serialized
+                    # the response
+                    g.callback_timings = (fn.__name__, timings, seconds)
+
+    return wrapper
+
+
+def instrumented_callback(app):
+    """Drop-in replacement for app.callback that records stage timings,
+    cache lookups and payload size for every callback it registers."""
+
+    def callback(*args, **kwargs):
+        def decorator(fn):
+            return app.callback(*args, **kwargs)(_timed(fn))
+
+        return decorator
+
+    return callback
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+
+
+def _after_request(response):
+    if "callback_timings" not in g or "request_start" not in g:
+        return response
+    name, timings, seconds = g.callback_timings
+    # Everything outside the callback itself: parsing the request, running
+    # the Dash wrapper and serializing the figure to JSON
+    serialize = max(time.perf_counter() - g.request_start - seconds, 0.0)
+    size = response.calculate_content_length() or 0
+    with _lock:
+        _metrics["stage_seconds"][name, "serialize"] += serialize
+        _metrics["payload_bytes"][name] += size
+
+    stages = dict(timings["stages"], serialize=serialize)
+    entries = [
+        f"{stage_name};dur={value * 1000:.1f}"
+        for stage_name, value in stages.items()
+        if value > 0
+    ]
+    if timings["cache"]:
+        entries.append(f'cache;desc="{",".join(timings["cache"])}"')
+    entries.append(f'cb;desc="{name}";dur={seconds * 1000:.1f}')
+    response.headers.add("Server-Timing", ", ".join(entries))
+    return response
+
+
+def _format(name, labels, value):
+    if labels:
+        text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+        return f"{name}{{{text}}} {value}"
+    return f"{name} {value}"
+
+
+def render_metrics():
+    """Current metrics of this worker in the Prometheus text format."""
+    with _lock:
+        metrics = {key: dict(values) for key, values in _metrics.items()}
+        metrics["buckets"] = {k: list(v) for k, v in metrics["buckets"].items()}
+    lines = [
+        "# HELP callback_duration_seconds Time spent inside each callback",
+        "# TYPE callback_duration_seconds histogram",
+    ]
+    for name, counts in metrics["buckets"].items():
+        cumulative = 0
+        for le, count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(
+                _format(
+                    "callback_duration_seconds_bucket",
+                    {"callback": name, "le": le},
+                    cumulative,
+                )
+            )
+        lines.append(
+            _format(
+                "callback_duration_seconds_sum",
+                {"callback": name},
+                metrics["seconds"][name],
+            )
+        )
+        lines.append(
+            _format(
+                "callback_duration_seconds_count",
+                {"callback": name},
+                metrics["calls"][name],
+            )
+        )
+
+    lines += [
+        "# HELP callback_calls_total Callback calls by outcome",
+        "# TYPE callback_calls_total counter",
+    ]
+    for (name, status), value in metrics["status"].items():
+        lines.append(
+            _format("callback_calls_total", {"callback": name, "status": status}, value)
+        )
+
+    lines += [
+        "# HELP callback_stage_seconds_total Time spent per callback stage",
+        "# TYPE callback_stage_seconds_total counter",
+    ]
+    for (name, stage_name), value in metrics["stage_seconds"].items():
+        lines.append(
+            _format(
+                "callback_stage_seconds_total",
+                {"callback": name, "stage": stage_name},
+                value,
+            )
+        )
+
+    lines += [
+        "# HELP callback_payload_bytes_total Response bytes sent per callback",
+        "# TYPE callback_payload_bytes_total counter",
+    ]
+    for name, value in metrics["payload_bytes"].items():
+        lines.append(_format("callback_payload_bytes_total", {"callback": name}, value))
+
+    lines += [
+        "# HELP callback_cache_lookups_total Query cache lookups per callback",
+        "# TYPE callback_cache_lookups_total counter",
+    ]
+    for (name, result), value in metrics["cache"].items():
+        lines.append(
+            _format(
+                "callback_cache_lookups_total",
+                {"callback": name, "result": result},
+                value,
+            )
+        )
+
+    cache_stats = query_cache.stats()
+    lines += [
+        "# HELP query_cache_items Query results in this worker's memory cache",
+        "# TYPE query_cache_items gauge",
+        _format("query_cache_items", {}, cache_stats.pop("items")),
+        "# HELP query_cache_lookups_total Query cache lookups, including prefetch",
+        "# TYPE query_cache_lookups_total counter",
+    ]
+    for result, value in cache_stats.items():
+        lines.append(_format("query_cache_lookups_total", {"result": result}, value))
+
+    lines += [
+        "# HELP db_queries_total Statements sent to the database",
+        "# TYPE db_queries_total counter",
+    ]
+    for query, value in get_query_counts().items():
+        lines.append(_format("db_queries_total", {"query": query}, value))
+
+    lines += [
+        "# HELP db_pool Connection pool state and checkout counters",
+        "# TYPE db_pool gauge",
+    ]
+    for key, value in get_pool_stats().items():
+        lines.append(_format("db_pool", {"stat": key}, value))
+    return "\n".join(lines) + "\n"
+
+
+def register_metrics(server):
+    server.before_request(_before_request)
+    server.after_request(_after_request)
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def _reset_after_fork():
+    global _metrics, _lock
+    # Each worker reports its own calls
+    _metrics = _empty_metrics()
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,206 @@
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from constants import (
+    CACHE_DIR,
+    MODE,
+    PREFETCH_BUDGET,
+    PREFETCH_ENABLED,
+    PREFETCH_QUEUE_SIZE,
+    WARMUP_SLICES,
+    WARMUP_TOP_N,
+)
+from utils.boundaries import available_adm_levels
+from utils.data_processing import load_data_handle, make_data_handle
+from utils.queries import DATASETS
+
+logger = logging.getLogger(__name__)
+
+LEADTIMES = [str(lt) for lt in range(7)]
+USAGE_PATH = os.path.join(CACHE_DIR or "/tmp", "usage.json")
+USAGE_FLUSH_SECONDS = 30
+
+
+def _new_state():
+    return {
+        "queue": queue.Queue(maxsize=PREFETCH_QUEUE_SIZE),
+        "thread": None,
+        "usage": Counter(),
+        "flushed": time.time(),
+        "warmed": False,
+    }
+
+
+_state = _new_state()
+_lock = threading.Lock()
+
+
+def _handle_key(handle):
+    return ":".join(
+        str(handle[k])
+        for k in ("dataset", "iso3", "adm_level", "lt")
+        if handle[k] is not None
+    )
+
+
+def _parse_handle_key(key):
+    dataset, iso3, adm_level, *lt = key.split(":")
+    return make_data_handle(iso3, adm_level, dataset, lt[0] if lt else None)
+
+
+def neighbours(handle):
+    """Slices a user is likely to look at after this one, most likely first."""
+    iso3, adm_level = handle["iso3"], str(handle["adm_level"])
+    dataset, lt = handle["dataset"], handle["lt"]
+    candidates = []
+    if dataset == "seas5" and lt is not None:
+        i = LEADTIMES.index(str(lt))
+        for j in (i + 1, i - 1):
+            if 0 <= j < len(LEADTIMES):
+                candidates.append(
+                    make_data_handle(iso3, adm_level, dataset, LEADTIMES[j])
+                )
+    for level in (int(adm_level) + 1, int(adm_level) - 1):
+        if level in available_adm_levels(iso3):
+            candidates.append(make_data_handle(iso3, str(level), dataset, lt))
+    for other in DATASETS:
+        if other != dataset:
+            other_lt = LEADTIMES[0] if other == "seas5" else None
+            candidates.append(make_data_handle(iso3, adm_level, other, other_lt))
+    return candidates
+
+
+def _enqueue(handles, budget):
+    queued = 0
+    for handle in handles:
+        if queued >= budget:
+            break
+        try:
+            _state["queue"].put_nowait(handle)
+        except queue.Full:
+            # Prefetching is best effort, drop work rather than fall behind
+            break
+        queued += 1
+    _ensure_worker()
+
+
+def _prefetch(handle):
+    try:
+        # Slices already on disk are just loaded into this worker's memory
+        start = time.perf_counter()
+        load_data_handle(handle)
+        logger.info(
+            "prefetched %s in %.2fs",
+            _handle_key(handle),
+            time.perf_counter() - start,
+        )
+    except Exception:
+        logger.exception("Prefetch of %s failed", _handle_key(handle))
+
+
+def _run():
+    if not _state["warmed"]:
+        _state["warmed"] = True
+        warm_up()
+    while True:
+        try:
+            handle = _state["queue"].get(timeout=USAGE_FLUSH_SECONDS)
+        except queue.Empty:
+            handle = None
+        # Usage is saved from this thread, so a request never waits on the
+        # lock file shared with the other workers
+        if _state["flushed"] + USAGE_FLUSH_SECONDS < time.time():
+            try:
+                _flush_usage()
+            except OSError:
+                logger.exception("Could not save slice usage")
+        if handle is not None:
+            _prefetch(handle)
+
+
+def _ensure_worker():
+    with _lock:
+        thread = _state["thread"]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_run, daemon=True, name="prefetch")
+            _state["thread"] = thread
+            thread.start()
+
+
+def _flush_usage():
+    # Counts from every worker are merged into one file, guarded by a lock
+    # file so concurrent flushes do not lose updates
+    with _lock:
+        usage, _state["usage"] = _state["usage"], Counter()
+        _state["flushed"] = time.time()
+    if not usage:
+        return
+    os.makedirs(os.path.dirname(USAGE_PATH), exist_ok=True)
+    with open(f"{USAGE_PATH}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        totals = Counter(_read_usage())
+        totals.update(usage)
+        tmp_path = f"{USAGE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(totals.most_common(1000)), f)
+        os.replace(tmp_path, USAGE_PATH)
+
+
+def _read_usage():
+    try:
+        with open(USAGE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def prefetch_neighbours(handle):
+    """Record that a slice was served and prefetch the likely next ones."""
+    if not PREFETCH_ENABLED or MODE == "local":
+        return
+    with _lock:
+        _state["usage"][_handle_key(handle)] += 1
+    _enqueue(neighbours(handle), PREFETCH_BUDGET)
+
+
+def warm_up():
+    """Queue the configured and most used slices for loading into the cache.
+
+    Run by each worker's prefetch thread when it starts.
+    """
+    keys = [key for key in WARMUP_SLICES.split(",") if key]
+    keys += [key for key, _ in Counter(_read_usage()).most_common(WARMUP_TOP_N)]
+    handles = []
+    for key in dict.fromkeys(keys):
+        try:
+            handles.append(_parse_handle_key(key))
+        except ValueError:
+            logger.warning("Ignoring invalid warm-up slice %s", key)
+    _enqueue(handles, PREFETCH_QUEUE_SIZE)
+
+
+def _start_worker():
+    if PREFETCH_ENABLED and MODE != "local":
+        _ensure_worker()
+
+
+def register_warm_up(server):
+    # Started by each worker's first request rather than at import, which
+    # under gunicorn --preload runs in the master and whose thread and warmed
+    # cache would not survive the fork
+    server.before_request(_start_worker)
+
+
+def _reset_after_fork():
+    global _state, _lock
+    _state = _new_state()
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
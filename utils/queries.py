@@ -0,0 +1,260 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+
+import pandas as pd
+from sqlalchemy import text
+
+from constants import DB_PREPARED_STATEMENTS
+from utils.timing import stage
+
+logger = logging.getLogger(__name__)
+
+DATASETS = ("era5", "seas5", "imerg")
+STATS = ("mean", "median", "max", "min", "count", "sum", "std")
+
+# Every table the app is allowed to read, identifiers are never taken from
+# user input directly
+TABLES = {
+    "iso3": "public.iso3",
+    **{dataset: f"public.{dataset}" for dataset in DATASETS},
+    **{
+        f"{dataset}_completeness": f"public.{dataset}_completeness"
+        for dataset in DATASETS
+    },
+}
+
+_query_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+class Query:
+    """A parameterised statement that can also run as a server-side prepared
+    statement, so Postgres parses and plans it once per connection."""
+
+    def __init__(self, name, sql, params=()):
+        self.name = name
+        self.params = params
+        self.statement = text(sql)
+        positional = sql
+        for i, param in enumerate(params, start=1):
+            positional = re.sub(rf":{param}\b", f"${i}", positional)
+        self.prepare = text(f"PREPARE {name} AS {positional}")
+        if params:
+            args = ", ".join(f":{param}" for param in params)
+            self.execute = text(f"EXECUTE {name}({args})")
+        else:
+            self.execute = text(f"EXECUTE {name}")
+
+
+def table_name(name):
+    try:
+        return TABLES[name]
+    except KeyError:
+        raise ValueError(f"Unknown table: {name}")
+
+
+def stat_column(stat):
+    if stat not in STATS:
+        raise ValueError(f"Unknown stat: {stat}")
+    return stat
+
+
+def slice_params(iso3, adm_level, lt=None, valid_date=None):
+    params = {"iso3": iso3, "adm_level": int(adm_level)}
+    if lt is not None:
+        params["leadtime"] = int(lt)
+    if valid_date is not None:
+        params["valid_date"] = date.fromisoformat(str(valid_date)[:10])
+    return params
+
+
+def _slice_filter(with_leadtime):
+    where = "iso3 = :iso3 AND adm_level = :adm_level"
+    params = ("iso3", "adm_level")
+    if with_leadtime:
+        where += " AND leadtime = :leadtime"
+        params += ("leadtime",)
+    return where, params
+
+
+@lru_cache(maxsize=None)
+def slice_query(dataset, with_leadtime=False):
+    where, params = _slice_filter(with_leadtime)
+    return Query(
+        f"slice_{dataset}{'_lt' if with_leadtime else ''}",
+        f"SELECT * FROM {table_name(dataset)} WHERE {where}",
+        params,
+    )
+
+
+@lru_cache(maxsize=None)
+def map_query(dataset, stat, with_leadtime=False):
+    where, params = _slice_filter(with_leadtime)
+    return Query(
+        f"map_{dataset}_{stat_column(stat)}{'_lt' if with_leadtime else ''}",
+        f"SELECT pcode, {stat} FROM {table_name(dataset)} "
+        f"WHERE {where} AND valid_date = :valid_date",
+        params + ("valid_date",),
+    )
+
+
+def batch_params(slices, lt=None, valid_dates=None):
+    params = {
+        "iso3s": [iso3 for iso3, _ in slices],
+        "adm_levels": [int(adm_level) for _, adm_level in slices],
+    }
+    if lt is not None:
+        params["leadtime"] = int(lt)
+    if valid_dates is not None:
+        params["valid_dates"] = [date.fromisoformat(str(d)[:10]) for d in valid_dates]
+    return params
+
+
+def _batch_filter(with_leadtime):
+    # Many (iso3, adm_level) slices in one statement: the pairs are bound as
+    # two arrays and zipped back together by unnest
+    where = (
+        "(iso3, adm_level) IN (SELECT * FROM unnest("
+        "CAST(:iso3s AS text[]), CAST(:adm_levels AS integer[])))"
+    )
+    params = ("iso3s", "adm_levels")
+    if with_leadtime:
+        where += " AND leadtime = :leadtime"
+        params += ("leadtime",)
+    return where, params
+
+
+@lru_cache(maxsize=None)
+def batch_map_query(dataset, stat, with_leadtime=False):
+    where, params = _batch_filter(with_leadtime)
+    return Query(
+        f"batch_map_{dataset}_{stat_column(stat)}{'_lt' if with_leadtime else ''}",
+        f"SELECT iso3, adm_level, valid_date, pcode, {stat} "
+        f"FROM {table_name(dataset)} "
+        f"WHERE {where} AND valid_date = ANY(CAST(:valid_dates AS date[]))",
+        params + ("valid_dates",),
+    )
+
+
+@lru_cache(maxsize=None)
+def iso3_query():
+    return Query("iso3_all", f"SELECT * FROM {table_name('iso3')}")
+
+
+@lru_cache(maxsize=None)
+def stats_versions_query():
+    return Query(
+        "iso3_versions",
+        f"SELECT iso3, stats_last_updated FROM {table_name('iso3')}",
+    )
+
+
+@lru_cache(maxsize=None)
+def completeness_query(dataset, by_iso3=False):
+    table = table_name(f"{dataset}_completeness")
+    if by_iso3:
+        return Query(
+            f"completeness_{dataset}_iso3",
+            f"SELECT * FROM {table} WHERE iso3 = :iso3",
+            ("iso3",),
+        )
+    return Query(f"completeness_{dataset}", f"SELECT * FROM {table}")
+
+
+@lru_cache(maxsize=None)
+def row_count_query(dataset):
+    return Query(f"row_count_{dataset}", f"SELECT COUNT(*) FROM {table_name(dataset)}")
+
+
+@lru_cache(maxsize=None)
+def latest_date_query(dataset):
+    # The latest date the pipeline has written. For seas5 that is the latest
+    # issue month, i.e. leadtime 0, as the other leadtimes run up to six
+    # months past it. With an index on (valid_date), or (leadtime, valid_date)
+    # for seas5, MAX is read from the end of the index instead of a scan
+    where = " WHERE leadtime = 0" if dataset == "seas5" else ""
+    return Query(
+        f"latest_date_{dataset}",
+        f"SELECT MAX(valid_date) FROM {table_name(dataset)}{where}",
+    )
+
+
+@lru_cache(maxsize=None)
+def row_estimate_query():
+    return Query(
+        "row_estimates",
+        "SELECT c.relname::text, c.reltuples::bigint FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = 'public' AND c.relname::text = ANY(:tables)",
+        ("tables",),
+    )
+
+
+def export_sql(dataset, stats=None, lt=None, start=None, end=None):
+    # Plain DBAPI (pyformat) SQL for the export route, which runs it through
+    # COPY or a server-side cursor rather than SQLAlchemy
+    if stats:
+        keys = ["iso3", "adm_level", "pcode", "valid_date"]
+        if dataset == "seas5":
+            keys.append("leadtime")
+        columns = ", ".join(keys + [stat_column(stat) for stat in stats])
+    else:
+        columns = "*"
+    where = ["iso3 = %(iso3)s", "adm_level = %(adm_level)s"]
+    if lt is not None:
+        where.append("leadtime = %(leadtime)s")
+    if start is not None:
+        where.append("valid_date >= %(start)s")
+    if end is not None:
+        where.append("valid_date <= %(end)s")
+    return (
+        f"SELECT {columns} FROM {table_name(dataset)} "
+        f"WHERE {' AND '.join(where)} ORDER BY valid_date, pcode"
+    )
+
+
+def _statement(con, query):
+    if not DB_PREPARED_STATEMENTS:
+        return query.statement
+    # Prepared statements live as long as the DBAPI connection, whose info
+    # dict is cleared whenever the pool replaces it
+    prepared = con.info.setdefault("prepared_statements", set())
+    if query.name not in prepared:
+        con.execute(query.prepare)
+        prepared.add(query.name)
+    return query.execute
+
+
+def count_query(name):
+    with _counts_lock:
+        _query_counts[name] += 1
+
+
+def get_query_counts():
+    # Number of statements sent to the database per query name, handy for
+    # checking how many round trips a user action costs
+    with _counts_lock:
+        return dict(_query_counts)
+
+
+def execute(con, query, **params):
+    count_query(query.name)
+    start = time.perf_counter()
+    with stage("sql"):
+        result = con.execute(_statement(con, query), params)
+    logger.debug("%s took %.3fs", query.name, time.perf_counter() - start)
+    return result
+
+
+def read_frame(con, query, **params):
+    count_query(query.name)
+    start = time.perf_counter()
+    with stage("sql"):
+        df = pd.read_sql_query(_statement(con, query), con, params=params)
+    logger.debug("%s took %.3fs", query.name, time.perf_counter() - start)
+    return df
@@ -0,0 +1,78 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from constants import DERIVED_STATS
+from utils.climatology import BASE_STAT, derived_series
+from utils.data_processing import fetch_data_from_db, slice_version
+from utils.queries import STATS
+
+
+class SeriesIndex:
+    """Time series of every pcode in a slice, stored as contiguous arrays.
+
+    Rows are sorted by pcode and then valid_date once, so each pcode's series
+    is a pair of offsets into one array per stat and looking it up does not
+    touch the rest of the slice.
+    """
+
+    def __init__(self, df):
+        pcodes = pd.Categorical(df.pcode)
+        codes = pcodes.codes
+        dates = df.valid_date.to_numpy()
+        order = np.lexsort((dates, codes))
+        order = order[codes[order] >= 0]
+        counts = np.bincount(codes[order], minlength=len(pcodes.categories))
+        stops = np.cumsum(counts)
+        self._offsets = {
+            pcode: (stop - count, stop)
+            for pcode, count, stop in zip(pcodes.categories, counts, stops)
+            if count
+        }
+        self.dates = np.ascontiguousarray(dates[order])
+        self.values = {
+            stat: np.ascontiguousarray(df[stat].to_numpy()[order])
+            for stat in STATS
+            if stat in df
+        }
+
+    def __contains__(self, pcode):
+        return pcode in self._offsets
+
+    def series(self, pcode, stat):
+        """Dates and values of one pcode, as views into the index."""
+        start, stop = self._offsets[pcode]
+        return self.dates[start:stop], self.values[stat][start:stop]
+
+
+@lru_cache(maxsize=16)
+def _build_index(dataset, iso3, adm_level, lt, version):
+    return SeriesIndex(fetch_data_from_db(iso3, adm_level, dataset, lt))
+
+
+def get_series_index(handle):
+    # Rebuilt whenever the pipeline bumps the country's stats_last_updated,
+    # like the slices it is made from
+    return _build_index(
+        handle["dataset"],
+        handle["iso3"],
+        str(handle["adm_level"]),
+        handle["lt"] or None,
+        slice_version(handle["iso3"]),
+    )
+
+
+def get_series(handle, pcodes, stat):
+    """Dates and values of stat for each of pcodes, derived stats included."""
+    index = get_series_index(handle)
+    series = {}
+    for pcode in pcodes:
+        if pcode not in index:
+            continue
+        if stat in DERIVED_STATS:
+            dates, values = index.series(pcode, BASE_STAT)
+            series[pcode] = (dates, derived_series(handle, pcode, dates, values, stat))
+        else:
+            series[pcode] = index.series(pcode, stat)
+    return series
@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from functools import partial
+
+from constants import MODE, SUMMARY_REFRESH_SECONDS
+from utils.date_utils import expected_rows
+from utils.db import connect, run_concurrently
+from utils.queries import (
+    DATASETS,
+    completeness_query,
+    execute,
+    iso3_query,
+    latest_date_query,
+    read_frame,
+    row_count_query,
+    row_estimate_query,
+)
+
+logger = logging.getLogger(__name__)
+
+# Latest snapshot per dataset, swapped in whole by the refresher so readers
+# never see a half-built one
+_snapshots = {}
+# Reentrant, as _refresh_if_missing holds it around refresh_summary
+_refresh_lock = threading.RLock()
+_refresher_lock = threading.Lock()
+_refresher = {"thread": None}
+
+
+def _build_summary(dataset, df_all_iso3s, df_completeness, latest_date):
+    df_merged = df_all_iso3s[
+        ["iso3", "stats_last_updated", "total-pcodes", "max_adm_level"]
+    ].merge(df_completeness, on="iso3", how="left")
+    df_grouped = (
+        df_merged.groupby("iso3")
+        .agg(
+            {
+                "stats_last_updated": "first",
+                "max_adm_level": "first",
+                "total-pcodes": "first",
+                "year": "count",
+                "total_rows": "sum",
+                "unique_pcodes": "first",
+            }
+        )
+        .reset_index()
+    )
+
+    # Every pcode should have a value for each date up to the latest one
+    # the pipeline has written for this dataset, none if it is still empty
+    if latest_date is None:
+        df_grouped["total_rows_correct"] = 0
+    else:
+        df_grouped["total_rows_correct"] = expected_rows(
+            dataset, df_grouped["total-pcodes"], latest_date
+        )
+    df_grouped["stats_last_updated"] = df_grouped["stats_last_updated"].astype(str)
+    return df_grouped
+
+
+def _read(query, **params):
+    with connect() as con:
+        return read_frame(con, query, **params)
+
+
+def _scalar(query, **params):
+    with connect() as con:
+        return execute(con, query, **params).scalar()
+
+
+def _estimate_row_counts():
+    # Planner statistics are kept up to date by autovacuum and cost nothing
+    # to read, unlike COUNT(*) over the full tables
+    with connect() as con:
+        rows = execute(con, row_estimate_query(), tables=list(DATASETS)).all()
+    return {name: int(estimate) for name, estimate in rows if estimate >= 0}
+
+
+def _count_missing_rows(counts):
+    # Tables that were never analyzed have no estimate yet. They are counted
+    # once the first batch has returned rather than from one of its tasks,
+    # which would wait on executor threads the batch itself is holding
+    missing = [dataset for dataset in DATASETS if dataset not in counts]
+    if not missing:
+        return counts
+    exact = run_concurrently(
+        {dataset: partial(_scalar, row_count_query(dataset)) for dataset in missing}
+    )
+    return {**counts, **exact}
+
+
+def _summary_tasks():
+    tasks = {"iso3": partial(_read, iso3_query()), "rows": _estimate_row_counts}
+    for dataset in DATASETS:
+        tasks[f"{dataset}_completeness"] = partial(_read, completeness_query(dataset))
+        tasks[f"{dataset}_latest"] = partial(_scalar, latest_date_query(dataset))
+    return tasks
+
+
+def _local_summary_tasks():
+    # Only imported in MODE=local, like in utils/data_processing.py
+    from utils import local_backend
+
+    tasks = {
+        "iso3": partial(local_backend.read_table, "iso3"),
+        "rows": lambda: {d: local_backend.count_rows(d) for d in DATASETS},
+    }
+    for dataset in DATASETS:
+        tasks[f"{dataset}_completeness"] = partial(
+            local_backend.read_table, f"{dataset}_completeness"
+        )
+        tasks[f"{dataset}_latest"] = partial(local_backend.latest_date, dataset)
+    return tasks
+
+
+def refresh_summary():
+    with _refresh_lock:
+        start = time.perf_counter()
+        if MODE == "local":
+            results = {name: fn() for name, fn in _local_summary_tasks().items()}
+        else:
+            results = run_concurrently(_summary_tasks())
+            results["rows"] = _count_missing_rows(results["rows"])
+
+        for dataset in DATASETS:
+            df_completeness = results[f"{dataset}_completeness"]
+            summary = _build_summary(
+                dataset, results["iso3"], df_completeness, results[f"{dataset}_latest"]
+            )
+            # Stored as records so callbacks can return them without converting
+            _snapshots[dataset] = {
+                "summary": summary,
+                "records": summary.to_dict("records"),
+                "detail": {
+                    iso3: df.to_dict("records")
+                    for iso3, df in df_completeness.groupby("iso3")
+                },
+                "row_count": results["rows"][dataset],
+                "refreshed": time.time(),
+            }
+        logger.info("Refreshed summary in %.2fs", time.perf_counter() - start)
+
+
+def _refresh_if_missing(dataset):
+    # Requests arriving together on a fresh worker wait for the first one's
+    # refresh instead of each running their own
+    with _refresh_lock:
+        if dataset in _snapshots:
+            return
+        refresh_summary()
+
+
+def _refresh_loop():
+    while True:
+        time.sleep(SUMMARY_REFRESH_SECONDS)
+        try:
+            refresh_summary()
+        except Exception:
+            logger.exception("Summary refresh failed")
+
+
+def _ensure_refresher():
+    # Started lazily so each gunicorn worker gets its own thread after fork
+    with _refresher_lock:
+        thread = _refresher["thread"]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_refresh_loop, daemon=True)
+            _refresher["thread"] = thread
+            thread.start()
+
+
+def get_snapshot(dataset):
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    if dataset not in _snapshots:
+        _refresh_if_missing(dataset)
+    _ensure_refresher()
+    return _snapshots[dataset]
+
+
+def get_completeness_summary(dataset):
+    return get_snapshot(dataset)["summary"]
+
+
+def get_completeness_records(dataset):
+    return get_snapshot(dataset)["records"]
+
+
+def get_completeness_detail(dataset, iso3):
+    return get_snapshot(dataset)["detail"].get(iso3, [])
+
+
+def get_row_counts():
+    return {dataset: get_snapshot(dataset)["row_count"] for dataset in DATASETS}
@@ -0,0 +1,174 @@
+import json
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+from flask import Response, abort, request
+
+from utils.boundaries import (
+    BOUNDARIES_DIR,
+    TOLERANCES,
+    available_adm_levels,
+    load_boundaries,
+    tolerance_for_zoom,
+)
+
+TILES_DIR = os.path.join(BOUNDARIES_DIR, "tiles")
+TILE_LAYER = "boundaries"
+TILE_EXTENT = 4096
+# Tiles up to this zoom are written by scripts/build_boundaries.py, deeper
+# ones are rendered on first request and kept in memory
+PREBUILT_MAX_ZOOM = 7
+MAX_TILE_ZOOM = 14
+# Tiles are clipped slightly outside their edges so outlines join up
+TILE_BUFFER = 64 / TILE_EXTENT
+
+# Boundaries only change when the deploy rebuilds them
+CACHE_HEADERS = {"Cache-Control": "public, max-age=86400"}
+
+EARTH_RADIUS = 6378137.0
+WORLD_HALF = math.pi * EARTH_RADIUS
+
+
+def tile_path(iso3, adm_level, z, x, y):
+    return os.path.join(
+        TILES_DIR, f"{iso3.lower()}_adm{adm_level}", str(z), str(x), f"{y}.pbf"
+    )
+
+
+def _to_mercator(coords):
+    lon, lat = coords[:, 0], np.clip(coords[:, 1], -85.0511, 85.0511)
+    x = np.radians(lon) * EARTH_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * EARTH_RADIUS
+    return np.column_stack([x, y])
+
+
+def tile_bounds(z, x, y):
+    """Web Mercator bounds (minx, miny, maxx, maxy) of a tile."""
+    size = 2 * WORLD_HALF / 2**z
+    minx = -WORLD_HALF + x * size
+    maxy = WORLD_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tiles_for_bbox(bbox, z):
+    """x, y of every tile at zoom z covering a lon/lat bbox."""
+    (minx, miny), (maxx, maxy) = _to_mercator(np.array([bbox[:2], bbox[2:]]))
+    size = 2 * WORLD_HALF / 2**z
+    last = 2**z - 1
+    x0 = min(max(int((minx + WORLD_HALF) // size), 0), last)
+    x1 = min(max(int((maxx + WORLD_HALF) // size), 0), last)
+    y0 = min(max(int((WORLD_HALF - maxy) // size), 0), last)
+    y1 = min(max(int((WORLD_HALF - miny) // size), 0), last)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+@lru_cache(maxsize=32)
+def _shapes(iso3, adm_level, tolerance):
+    # shapely is only needed for tiles that were not pre-generated, so it is
+    # imported on the first of those instead of at worker startup
+    import shapely
+    from shapely.geometry import shape
+
+    geojson = load_boundaries(iso3, adm_level, tolerance)
+    key = f"ADM{adm_level}_PCODE"
+    geometries = np.array(
+        [
+            shapely.transform(shape(feature["geometry"]), _to_mercator)
+            for feature in geojson["features"]
+        ]
+    )
+    properties = [
+        {"pcode": feature["properties"][key]} for feature in geojson["features"]
+    ]
+    return shapely.STRtree(geometries), geometries, properties
+
+
+def render_tile(iso3, adm_level, z, x, y):
+    """Encode one tile as MVT, or return None if no boundary touches it."""
+    import mapbox_vector_tile
+    import shapely
+
+    tree, geometries, properties = _shapes(iso3, adm_level, tolerance_for_zoom(z))
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    buffer = (maxx - minx) * TILE_BUFFER
+    clip = (minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+    features = []
+    for i in tree.query(shapely.box(*clip)):
+        geometry = shapely.clip_by_rect(geometries[i], *clip)
+        if not geometry.is_empty:
+            features.append({"geometry": geometry, "properties": properties[i]})
+    if not features:
+        return None
+    return mapbox_vector_tile.encode(
+        [{"name": TILE_LAYER, "features": features}],
+        default_options={
+            "quantize_bounds": (minx, miny, maxx, maxy),
+            "extents": TILE_EXTENT,
+        },
+    )
+
+
+@lru_cache(maxsize=4096)
+def get_tile(iso3, adm_level, z, x, y):
+    """MVT bytes for a tile, empty if it has no boundaries in it."""
+    path = tile_path(iso3, adm_level, z, x, y)
+    if z <= PREBUILT_MAX_ZOOM and os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    return render_tile(iso3, adm_level, z, x, y) or b""
+
+
+def map_urls(iso3, adm_level, tolerance):
+    """Absolute URLs of the fill GeoJSON and outline tiles for a map figure.
+
+    Tile URLs are fetched from a web worker, where relative ones do not
+    resolve, so both are built from the current request's scheme and host
+    (as forwarded by the proxy, see ProxyFix in app.py).
+    """
+    base = request.host_url.rstrip("/")
+    iso3 = iso3.upper()
+    return {
+        "geojson_url": (
+            f"{base}/boundaries/{iso3}/{adm_level}.geojson?tolerance={tolerance:g}"
+        ),
+        "tiles_url": f"{base}/tiles/{iso3}/{adm_level}/{{z}}/{{x}}/{{y}}.pbf",
+    }
+
+
+def _check_slice(iso3, adm_level):
+    if len(iso3) != 3 or not iso3.isalpha():
+        abort(404)
+    if adm_level not in available_adm_levels(iso3.upper()):
+        abort(404)
+
+
+def register_tile_routes(server):
+    @server.route("/tiles/<iso3>/<int:adm_level>/<int:z>/<int:x>/<int:y>.pbf")
+    def boundary_tile(iso3, adm_level, z, x, y):
+        _check_slice(iso3, adm_level)
+        if z > MAX_TILE_ZOOM or x >= 2**z or y >= 2**z:
+            abort(404)
+        tile = get_tile(iso3.upper(), adm_level, z, x, y)
+        if not tile:
+            return Response(status=204, headers=CACHE_HEADERS)
+        return Response(
+            tile, mimetype="application/vnd.mapbox-vector-tile", headers=CACHE_HEADERS
+        )
+
+    @server.route("/boundaries/<iso3>/<int:adm_level>.geojson")
+    def boundary_geojson(iso3, adm_level):
+        # Referenced by URL from the map figure, so the browser downloads
+        # (and caches) the geometry once instead of with every figure
+        _check_slice(iso3, adm_level)
+        try:
+            tolerance = float(request.args.get("tolerance", TOLERANCES[-1]))
+        except ValueError:
+            abort(400)
+        if tolerance not in TOLERANCES:
+            abort(400)
+        geojson = load_boundaries(iso3.upper(), adm_level, tolerance)
+        return Response(
+            json.dumps(geojson), mimetype="application/geo+json", headers=CACHE_HEADERS
+        )
@@ -0,0 +1,39 @@
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Stage timings of the callback running in this context, None outside one.
+# Kept apart from utils/metrics.py so low-level modules can record into it
+# without importing Flask or Dash
+_current = contextvars.ContextVar("callback_timings", default=None)
+
+
+@contextmanager
+def collect():
+    timings = {"stages": defaultdict(float), "cache": []}
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in this block to the current callback's stage."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings["stages"][name] += time.perf_counter() - start
+
+
+def record_cache(result):
+    timings = _current.get()
+    if timings is not None:
+        timings["cache"].append(result)